@@ -0,0 +1,127 @@
+# async_network.py
+# (模型层/网络层)：基于 asyncio 的 UDP 通信
+# 与 CommManager 接口一致（start / send / drain / close），收包、重传、分片超时清理都在同一个事件循环线程里完成
+import asyncio
+import threading
+
+from network import CommManager
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, manager):
+        self.manager = manager
+
+    def datagram_received(self, data, addr):
+        self.manager._on_datagram(data, addr)
+
+    def error_received(self, exc):
+        pass  # 对端不可达等 ICMP 错误，UDP 下忽略
+
+
+class AsyncCommManager(CommManager):
+    """
+    事件循环运行在独立线程中。所有回调（on_message_received / on_status）都在该线程触发，
+    调用方负责转回 Tk 主线程（见 UltimateChat.post_to_ui）。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.transport = None
+        self._thread = None
+        self._ack_scheduled = False
+
+    def start(self):
+        try:
+            self._bind()
+            self.sock.setblocking(False)
+        except Exception as e:
+            return str(e)
+
+        ready = threading.Event()
+        result = {}
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self._open())
+            except Exception as e:
+                result["error"] = str(e)
+                ready.set()
+                self.loop.close()
+                return
+            ready.set()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        if "error" in result:
+            return result["error"]
+        self.running = True
+        # 接收池的额外 socket 仍由各自的线程读取，结果汇入同一个 inbox
+        self._start_pool()
+        return True
+
+    async def _open(self):
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: _DatagramProtocol(self), sock=self.sock)
+        self.loop.call_later(1.0, self._expire_tick)
+        if self.reliable:
+            self.loop.call_later(0.01, self._retransmit_tick)
+
+    # ================= 事件循环线程内 =================
+    def _on_datagram(self, data, addr):
+        self._handle_datagram(data, addr)
+        # 同一轮事件循环里收到的数据报只合并发一次 ACK
+        if self._pending_acks and not self._ack_scheduled:
+            self._ack_scheduled = True
+            self.loop.call_soon(self._flush_acks_soon)
+
+    def _flush_acks_soon(self):
+        self._ack_scheduled = False
+        self._flush_acks()
+
+    def _expire_tick(self):
+        self.reassembler.expire()
+        self.loop.call_later(1.0, self._expire_tick)
+
+    def _retransmit_tick(self):
+        for datagram, addr in self.reliable.poll():
+            self._sendto_all([datagram], addr)
+        self.loop.call_later(0.01, self._retransmit_tick)
+
+    def _sendto_all(self, datagrams, addr):
+        if self.transport is None or self.transport.is_closing():
+            return
+        for datagram in datagrams:
+            self.transport.sendto(datagram, addr)
+
+    async def send_async(self, msg, target_addr, token=None):
+        """协程版发送：transport.sendto 只写入缓冲区，不会阻塞事件循环"""
+        CommManager.send(self, msg, target_addr, token)
+
+    # ================= 任意线程调用 =================
+    def send(self, msg, target_addr, token=None):
+        if not self.running:
+            return
+        asyncio.run_coroutine_threadsafe(self.send_async(msg, target_addr, token), self.loop)
+
+    def close(self):
+        if not self.running:
+            self.sock.close()
+            return
+        self.running = False
+
+        def shutdown():
+            if self.transport:
+                # transport.close() 把 connection_lost（真正关闭 socket）排到下一轮，
+                # 停止循环也要排在它之后，否则 socket 不会被释放
+                self.transport.close()
+            self.loop.call_soon(self.loop.stop)
+
+        self.loop.call_soon_threadsafe(shutdown)
+        self._thread.join(timeout=2)
+        for lane in self.lanes:
+            lane.close()
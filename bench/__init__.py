@@ -0,0 +1,2 @@
+# bench: 消息热路径的性能基准
+# 用法（在项目根目录）: python -m bench.run --out bench_result.json
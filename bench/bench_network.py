@@ -0,0 +1,113 @@
+# bench/bench_network.py
+# 网络热路径基准：CommManager 经回环地址发到 ChatCore
+# 测量 发送 -> 接收队列 -> 入库 (history append) -> [可选] 视图插入 的端到端延迟，以及不丢包的最大吞吐
+import contextlib
+import threading
+import time
+
+from bench.common import temp_db, percentiles
+from network import CommManager
+from core import ChatCore
+
+
+def _make_payload(size):
+    stamp = f"{time.perf_counter():.9f} "
+    return stamp + "x" * max(0, size - len(stamp))
+
+
+@contextlib.contextmanager
+def _pair():
+    """启动一对收发端，退出时关闭两端并删除临时数据库"""
+    with temp_db("bench.db") as path:
+        receiver = ChatCore(port=0, history_path=path, discovery=False)
+        sender = CommManager(0, None, frame_unknown_peers=True)
+        try:
+            err = receiver.start()
+            if err is not True:
+                raise RuntimeError(err)
+            err = sender.start()
+            if err is not True:
+                raise RuntimeError(err)
+            yield sender, receiver, ("127.0.0.1", receiver.network.sock.getsockname()[1])
+        finally:
+            sender.close()
+            receiver.close()
+
+
+def _paced_send(sender, addr, count, size, rate, done):
+    # rate <= 0 表示不限速；否则每毫秒发送一小批，尽量贴近目标速率
+    start = time.perf_counter()
+    for i in range(count):
+        if rate > 0:
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0.001:
+                time.sleep(delay)
+        sender.send(_make_payload(size), addr)
+    done.set()
+
+
+def _drive(receiver, done, frame_ms, idle_timeout=0.5):
+    # 模拟界面帧循环：每 frame_ms 调用一次 process_pending，发送结束后再等待 idle_timeout 收尾
+    last_recv = time.perf_counter()
+    while True:
+        if receiver.process_pending():
+            last_recv = time.perf_counter()
+        elif done.is_set() and time.perf_counter() - last_recv > idle_timeout:
+            return
+        time.sleep(frame_ms / 1000)
+
+
+def run_latency(count=2000, size=64, rate=2000, frame_ms=16, sink=None):
+    """sink(batch) 可选：在入库之后模拟视图插入，计入延迟"""
+    latencies = []
+
+    def on_messages(batch):
+        if sink:
+            sink(batch)
+        now = time.perf_counter()
+        for _, _, rec in batch:
+            latencies.append((now - float(rec["msg"].split(" ", 1)[0])) * 1000)
+
+    with _pair() as (sender, receiver, addr):
+        receiver.subscribe("messages", on_messages)
+        done = threading.Event()
+        threading.Thread(target=_paced_send, args=(sender, addr, count, size, rate, done), daemon=True).start()
+        _drive(receiver, done, frame_ms)
+    return {
+        "count": count,
+        "size": size,
+        "rate": rate,
+        "frame_ms": frame_ms,
+        "received": len(latencies),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def run_throughput(rates=(1000, 5000, 10000, 20000, 50000), duration=1.0, size=64, frame_ms=16):
+    """逐级提高发送速率，记录每一级的接收条数，找出不丢包的最大速率"""
+    steps = []
+    best = 0
+    for rate in rates:
+        with _pair() as (sender, receiver, addr):
+            received = []
+            receiver.subscribe("messages", lambda batch: received.append(len(batch)))
+            count = int(rate * duration)
+            done = threading.Event()
+            start = time.perf_counter()
+            threading.Thread(target=_paced_send, args=(sender, addr, count, size, rate, done), daemon=True).start()
+            _drive(receiver, done, frame_ms)
+            got = sum(received)
+            steps.append(
+                {
+                    "target_rate": rate,
+                    "sent": count,
+                    "received": got,
+                    "dropped": count - got,
+                    "queue_dropped": receiver.network.total("dropped"),
+                    "elapsed_s": time.perf_counter() - start,
+                }
+            )
+        if got == count:
+            best = rate
+    return {"size": size, "duration_s": duration, "steps": steps, "max_rate_without_drops": best}
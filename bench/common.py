@@ -0,0 +1,28 @@
+# bench/common.py
+# 基准测试公共工具：路径、临时目录、百分位统计
+import contextlib
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@contextlib.contextmanager
+def temp_db(name):
+    """临时数据库路径，退出时连同 WAL / SHM 文件所在目录一起删除（调用方需先关闭数据库）"""
+    with tempfile.TemporaryDirectory(prefix="gui_chat_bench_") as path:
+        yield os.path.join(path, name)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """返回 {"p50": ..., "p90": ..., "p99": ..., "max": ...}，单位与输入一致"""
+    if not samples:
+        return {}
+    data = sorted(samples)
+    result = {f"p{p}": data[min(len(data) - 1, int(len(data) * p / 100))] for p in points}
+    result["max"] = data[-1]
+    result["mean"] = sum(data) / len(data)
+    return result
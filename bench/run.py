@@ -0,0 +1,59 @@
+# bench/run.py
+# 运行全部基准并输出 JSON（stdout 或 --out 指定的文件），便于在不同提交之间对比
+import argparse
+import json
+import platform
+import sys
+import time
+
+from bench import bench_network, bench_render
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="gui_chat 性能基准")
+    parser.add_argument("--count", type=int, default=2000, help="延迟测试的消息条数")
+    parser.add_argument("--size", type=int, default=64, help="单条消息字节数")
+    parser.add_argument("--rate", type=int, default=2000, help="延迟测试的发送速率 (msgs/sec)，0 为不限速")
+    parser.add_argument("--frame-ms", type=int, default=16, help="模拟界面帧间隔，与 FRAME_INTERVAL_MS 一致")
+    parser.add_argument("--rates", default="1000,5000,10000,20000,50000", help="吞吐测试的逐级速率")
+    parser.add_argument("--duration", type=float, default=1.0, help="吞吐测试每一级的持续秒数")
+    parser.add_argument("--render-sizes", default="1000,10000,100000", help="渲染测试的记录条数")
+    parser.add_argument("--skip-render", action="store_true", help="跳过需要图形环境的测试")
+    parser.add_argument("--out", help="结果写入文件，默认输出到 stdout")
+    args = parser.parse_args(argv)
+
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        }
+    }
+
+    root, sink = (None, None) if args.skip_render else bench_render.make_text_sink()
+    try:
+        result["latency"] = bench_network.run_latency(args.count, args.size, args.rate, args.frame_ms, sink)
+        result["latency"]["view_insert"] = sink is not None
+    finally:
+        if root is not None:
+            root.destroy()
+
+    rates = [int(r) for r in args.rates.split(",") if r]
+    result["throughput"] = bench_network.run_throughput(rates, args.duration, args.size, args.frame_ms)
+
+    if args.skip_render:
+        result["render"] = {"skipped": "--skip-render"}
+    else:
+        result["render"] = bench_render.run([int(n) for n in args.render_sizes.split(",") if n])
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 # components.py
-# (基建层)：存放通用的 UI 组件（如智能滚动条）和工具类（如重定向器）
+# (基建层)：存放通用的 UI 组件（如智能滚动条）和工具类
 
 import tkinter as tk
+from tkinter import font as tkfont
+import codecs
+import mmap
+import os
 import socket
-from ctypes import windll, c_int, byref, sizeof
+import time
+from collections import deque
 
 
 def get_local_ip():
@@ -17,48 +22,6 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-class WindowsTitleBarFix:
-    """
-    专门用于修复 Windows 11/10 下 Tkinter 窗口标题栏颜色的工具类。
-    可以让标题栏变成深色，保持系统圆角。
-    """
-
-    @staticmethod
-    def apply_dark_title_bar(root):
-        """强制应用 Windows 深色标题栏属性"""
-        try:
-            hwnd = windll.user32.GetParent(root.winfo_id())
-            # DWMWA_USE_IMMERSIVE_DARK_MODE = 20 (Windows 11 / Windows 10 2004+)
-            value = c_int(1)  # 1 = True (Dark)
-            windll.dwmapi.DwmSetWindowAttribute(hwnd, 20, byref(value), sizeof(value))
-        except Exception:
-            pass  # 非 Windows 系统或版本过低忽略
-
-    @staticmethod
-    def apply_light_title_bar(root):
-        """强制应用 Windows 浅色标题栏属性"""
-        try:
-            hwnd = windll.user32.GetParent(root.winfo_id())
-            value = c_int(0)  # 0 = False (Light)
-            windll.dwmapi.DwmSetWindowAttribute(hwnd, 20, byref(value), sizeof(value))
-        except Exception:
-            pass
-
-
-class StdoutRedirector:
-    """重定向 stdout 用于捕获 Python 解释器输出"""
-
-    def __init__(self, callback):
-        self.callback = callback
-
-    def write(self, text):
-        if text:
-            self.callback(text)
-
-    def flush(self):
-        pass
-
-
 class SmartScrollbar(tk.Canvas):
     """自定义美化滚动条 (优化版)"""
 
@@ -133,3 +96,722 @@ class SmartScrollbar(tk.Canvas):
                 state="hidden" if self.auto_hide else "normal",
                 fill=self.thumb_color,
             )
+
+
+class ThemeBinder:
+    """
+    记录控件 / Text 标签的颜色选项取自配色表的哪个键，切换深浅色时按新配色表原地重设，视图不必重建。
+    选项值可以是配色表的键，也可以是 (深色值, 浅色值) 二元组（配色表里没有的零散颜色）。
+    """
+
+    def __init__(self, schemes, is_dark):
+        self.schemes = schemes  # {"dark": {...}, "light": {...}}
+        self.is_dark = is_dark
+        self._widgets = []  # [(控件, {选项: 键}), ...]
+        self._tags = []  # [(Text, 标签名, {选项: 键}), ...]
+
+    @property
+    def scheme(self):
+        return self.schemes["dark" if self.is_dark else "light"]
+
+    def _resolve(self, roles):
+        return {opt: (role[0] if self.is_dark else role[1]) if isinstance(role, tuple) else self.scheme[role] for opt, role in roles.items()}
+
+    def __call__(self, widget, **roles):
+        """登记并立即套用，返回控件本身，便于 tk.Frame(...).pack() 之前直接包一层"""
+        widget.config(**self._resolve(roles))
+        self._widgets.append((widget, roles))
+        return widget
+
+    def tag(self, text, name, **roles):
+        text.tag_config(name, **self._resolve(roles))
+        self._tags.append((text, name, roles))
+
+    def apply(self, is_dark):
+        self.is_dark = is_dark
+        alive = []
+        for widget, roles in self._widgets:
+            if widget.winfo_exists():  # 跳过已销毁的控件（例如切换 Ribbon 标签页时重建的工具栏）
+                widget.config(**self._resolve(roles))
+                alive.append((widget, roles))
+        self._widgets = alive
+        for text, name, roles in self._tags:
+            text.tag_config(name, **self._resolve(roles))
+
+
+class RenderScheduler:
+    """
+    Text 控件的按帧合并写入：write() 只放进缓冲区，每帧最多 flush 一次
+    （一次 state 切换、一次 insert、一次滚动）。用户向上翻看时不自动滚到底部；
+    max_lines 不为空时裁掉最早的行，Text 不会无限增长
+    """
+
+    def __init__(self, text, scrollbar=None, interval=16, max_lines=None, on_flush=None):
+        self.text = text
+        self.scrollbar = scrollbar  # SmartScrollbar，用 current_hi 判断是否停在底部；没有时查询 yview
+        self.interval = interval
+        self.max_lines = max_lines
+        self.on_flush = on_flush  # on_flush(follow)：插入之后、恢复 state 之前调用
+        self._pending = []  # (文本, 标签, 文本, 标签, ...)
+        self._job = None
+
+    def write(self, text, tag=()):
+        self._pending.extend((text, tag))
+        self._schedule()
+
+    def extend(self, segments):
+        self._pending.extend(segments)
+        self._schedule()
+
+    def _schedule(self):
+        if self._job is None:
+            self._job = self.text.after(self.interval, self.flush)
+
+    def _at_bottom(self):
+        hi = self.scrollbar.current_hi if self.scrollbar is not None else self.text.yview()[1]
+        return hi >= 0.999
+
+    def flush(self):
+        """立即写入缓冲区中的全部内容（需要读取 Text 内容前调用）"""
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        if not self._pending:
+            return
+        follow = self._at_bottom()
+        segments, self._pending = self._pending, []
+
+        prev = self.text.cget("state")
+        self.text.config(state="normal")
+        self.text.insert(tk.END, *segments)
+        if self.max_lines:
+            lines = int(self.text.index("end-1c").split(".")[0])
+            if lines > self.max_lines:
+                self.text.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        if self.on_flush:
+            self.on_flush(follow)
+        self.text.config(state=prev)
+        if follow:
+            self.text.see(tk.END)
+
+    def discard(self):
+        """丢弃尚未写入的内容（视图整体重绘前调用）"""
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        self._pending = []
+
+
+class HistoryWindow:
+    """
+    聊天记录窗口化渲染：Text 中只保留最近一段记录，
+    滚动到顶部附近时再按页补齐更早的记录，并限制存活的记录条数。
+    """
+
+    def __init__(self, text, segments_fn, page_size=100, max_live=500, top_threshold=0.05, scrollbar=None, interval=16):
+        self.text = text
+        self.segments_fn = segments_fn  # (record, name) -> (文本, 标签, 文本, 标签, ...)
+        self.page_size = page_size
+        self.max_live = max_live
+        self.top_threshold = top_threshold
+
+        self.records = []
+        self.name = None
+        self.start = 0  # 窗口内第一条记录在 records 中的下标
+        self.end = 0  # 窗口内最后一条记录之后的下标
+        # 每个存活条目: (换行数, 是否以换行结尾, 是否为记录)，log() 写入的临时文本也计入，保证裁剪时行号准确
+        self._entries = deque()
+        self._loading = False
+        # 新消息 / 提示文本按帧合并写入，行数在真正插入时才计入 _entries
+        self.scheduler = RenderScheduler(text, scrollbar, interval, on_flush=self._on_flush)
+        self._pending_entries = []
+
+    def _build(self, records):
+        segments, entries = [], []
+        for rec in records:
+            seg = self.segments_fn(rec, self.name)
+            segments.extend(seg)
+            entries.append((sum(s.count("\n") for s in seg[0::2]), True, True))
+        return segments, entries
+
+    def _editable(self):
+        prev = self.text.cget("state")
+        self.text.config(state="normal")
+        return prev
+
+    def load(self, records, name):
+        """重新加载：只渲染最后一页"""
+        self._discard_pending()
+        self.records = records
+        self.name = name
+        self.end = len(records)
+        self.start = max(0, self.end - self.page_size)
+
+        prev = self._editable()
+        self.text.delete("1.0", tk.END)
+        self._entries.clear()
+        segments, entries = self._build(records[self.start : self.end])
+        if segments:
+            self.text.insert(tk.END, *segments)
+        self._entries.extend(entries)
+        self.text.see(tk.END)
+        self.text.config(state=prev)
+
+    def sync(self, records, name):
+        """视图复用时调用：同一会话只补上次渲染之后新增的记录，否则整页重载"""
+        if records is not self.records or name != self.name:
+            self.load(records, name)
+        elif self.end < len(records):
+            self.append(records[self.end :], name)
+
+    def load_around(self, records, name, index):
+        """重新加载并定位到第 index 条记录（搜索跳转），返回该记录在 Text 中的 (起始, 结束) 位置"""
+        self._discard_pending()
+        self.records = records
+        self.name = name
+        self.start = max(0, index - self.page_size // 2)
+        self.end = min(len(records), self.start + self.page_size)
+
+        prev = self._editable()
+        self.text.delete("1.0", tk.END)
+        self._entries.clear()
+        segments, entries = self._build(records[self.start : self.end])
+        if segments:
+            self.text.insert(tk.END, *segments)
+        self._entries.extend(entries)
+        self.text.config(state=prev)
+
+        line = 1 + sum(lines for lines, _, _ in entries[: index - self.start])
+        return f"{line}.0", f"{line + entries[index - self.start][0]}.0"
+
+    def append(self, records, name):
+        """追加新记录（记录已写入 self.records 尾部）"""
+        if self.end < len(self.records) - len(records):
+            # 窗口不在最新位置（翻看旧记录或搜索跳转），不打断用户，向下滚动时由 load_newer 补齐
+            return
+        self.name = self.name or name
+        segments, entries = [], []
+        for rec in records:
+            seg = self.segments_fn(rec, name)
+            segments.extend(seg)
+            entries.append((sum(s.count("\n") for s in seg[0::2]), True, True))
+
+        # end 立即前移，同一帧内的多次 append 才能判断为连续追加；文本在下一帧统一插入
+        self.end = min(self.end + len(records), len(self.records))
+        self._pending_entries.extend(entries)
+        self.scheduler.extend(segments)
+
+    def append_raw(self, text, tag):
+        """追加非记录文本（如系统提示），同样参与行数统计"""
+        self._pending_entries.append((text.count("\n"), not text or text.endswith("\n"), False))
+        self.scheduler.write(text, tag)
+
+    def flush(self):
+        self.scheduler.flush()
+
+    def _on_flush(self, follow):
+        self._entries.extend(self._pending_entries)
+        self._pending_entries = []
+        if len(self._entries) <= self.max_live:
+            return
+        if follow:
+            self._trim_top()
+        else:
+            # 用户正在往上翻看：裁剪顶部时保持当前可见位置不动
+            self.text.mark_set("history_anchor", "@0,0")
+            self._trim_top()
+            self.text.yview("history_anchor")
+
+    def _discard_pending(self):
+        self.scheduler.discard()
+        self._pending_entries = []
+
+    def clear(self):
+        self._discard_pending()
+        prev = self._editable()
+        self.text.delete("1.0", tk.END)
+        self.text.config(state=prev)
+        self._entries.clear()
+        self.records = []
+        self.name = None
+        self.start = self.end = 0
+
+    # 裁剪按整行进行：不以换行结尾的条目（提示符等 no_newline 文本）和同一行上相邻的条目一起删除，
+    # 删除边界因此总在行首，只需累计换行数即可定位
+    def _trim_top(self):
+        lines, partial = 0, False
+        while self._entries and (len(self._entries) > self.max_live or partial):
+            count, ends_line, is_record = self._entries.popleft()
+            lines += count
+            partial = not ends_line
+            if is_record:
+                self.start += 1
+        self.text.delete("1.0", "end-1c" if partial else f"{lines + 1}.0")
+
+    def _trim_bottom(self):
+        lines, trimmed = 0, False
+        while self._entries and (len(self._entries) > self.max_live or (trimmed and not self._entries[-1][1])):
+            count, _, is_record = self._entries.pop()
+            trimmed = True
+            lines += count
+            if is_record:
+                self.end -= 1
+        if trimmed:
+            self.text.delete(f"end-1c linestart -{lines} lines", "end-1c")
+
+    def load_older(self):
+        """在顶部插入上一页记录，并保持当前可见位置不跳动"""
+        self._loading = False
+        self.flush()
+        if self.start <= 0:
+            return
+        new_start = max(0, self.start - self.page_size)
+        segments, entries = self._build(self.records[new_start : self.start])
+
+        prev = self._editable()
+        self.text.mark_set("history_anchor", "@0,0")
+        self.text.insert("1.0", *segments)
+        self._entries.extendleft(reversed(entries))
+        self.start = new_start
+        self._trim_bottom()
+        self.text.yview("history_anchor")
+        self.text.config(state=prev)
+
+    def load_newer(self):
+        """在底部追加下一页记录（窗口不在最新位置时），并保持当前可见位置不跳动"""
+        self._loading = False
+        self.flush()
+        if self.end >= len(self.records):
+            return
+        new_end = min(len(self.records), self.end + self.page_size)
+        segments, entries = self._build(self.records[self.end : new_end])
+
+        prev = self._editable()
+        self.text.mark_set("history_anchor", "@0,0")
+        self.text.insert(tk.END, *segments)
+        self._entries.extend(entries)
+        self.end = new_end
+        self._trim_top()
+        self.text.yview("history_anchor")
+        self.text.config(state=prev)
+
+    def on_yscroll(self, lo, hi):
+        """挂到 Text 的 yscrollcommand 上：接近顶部 / 底部时懒加载更早 / 更新的记录"""
+        try:
+            lo, hi = float(lo), float(hi)
+        except (TypeError, ValueError):
+            return
+        if self._loading:
+            return
+        if lo <= self.top_threshold and self.start > 0:
+            self._loading = True
+            self.text.after_idle(self.load_older)
+        elif hi >= 1 - self.top_threshold and self.end < len(self.records):
+            self._loading = True
+            self.text.after_idle(self.load_newer)
+
+
+class SearchPopup(tk.Toplevel):
+    """
+    聊天记录搜索窗口：输入关键字回车搜索，双击或回车打开结果。
+    search_fn(query) -> [(显示文本, 结果), ...]；open_fn(结果) 负责跳转
+    """
+
+    def __init__(self, master, search_fn, open_fn, query="", bg="#ffffff", fg="#000000"):
+        super().__init__(master, bg=bg)
+        self.title("搜索聊天记录")
+        self.geometry("520x420")
+        self.transient(master)
+        self.search_fn = search_fn
+        self.open_fn = open_fn
+        self.hits = []
+
+        self.query_var = tk.StringVar(value=query)
+        entry = tk.Entry(self, textvariable=self.query_var, bg=bg, fg=fg, insertbackground=fg, font=("微软雅黑", 11))
+        entry.pack(fill="x", padx=10, pady=(10, 5), ipady=3)
+        entry.bind("<Return>", lambda e: self.run_search())
+        entry.focus_set()
+
+        self.status = tk.Label(self, bg=bg, fg="#888", anchor="w", font=("微软雅黑", 8))
+        self.status.pack(fill="x", padx=10)
+
+        self.result_list = tk.Listbox(self, bg=bg, fg=fg, bd=0, highlightthickness=0, activestyle="none", font=("微软雅黑", 10))
+        self.result_list.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+        self.result_list.bind("<Double-Button-1>", self._open_selected)
+        self.result_list.bind("<Return>", self._open_selected)
+        self.bind("<Escape>", lambda e: self.destroy())
+
+        if query.strip():
+            self.run_search()
+
+    def run_search(self):
+        start = time.perf_counter()
+        results = self.search_fn(self.query_var.get())
+        elapsed = (time.perf_counter() - start) * 1000
+        self.hits = [hit for _, hit in results]
+        self.result_list.delete(0, tk.END)
+        self.result_list.insert(tk.END, *(label for label, _ in results))
+        self.status.config(text=f"{len(results)} 条结果，{elapsed:.1f} ms")
+
+    def _open_selected(self, event=None):
+        sel = self.result_list.curselection()
+        if sel:
+            self.open_fn(self.hits[sel[0]])
+
+
+class StyleRegistry:
+    """
+    Text 字符样式登记表：每种样式组合（字体 / 字号 / 粗斜体 / 下划线 / 删除线 / 前景 / 底纹）只对应一个标签，
+    任一字符最多带一个样式标签，相同组合复用同一标签，Tk 会把相邻的同标签区间合并成一段。
+    不再被任何字符使用的标签随即删除，Font 对象按 (字体, 字号, 粗体, 斜体) 缓存并按引用计数释放。
+    """
+
+    FONT_ATTRS = ("family", "size", "bold", "italic")
+
+    def __init__(self, text, base_font, prefix="style_"):
+        self.text = text
+        self.base_family, self.base_size = base_font[0], base_font[1]
+        self.prefix = prefix
+        self._seq = 0
+        self._tag_of = {}  # 样式 key -> 标签名
+        self._key_of = {}  # 标签名 -> 样式 key
+        self._fonts = {}  # (family, size, bold, italic) -> [Font, 引用数]
+
+    def __len__(self):
+        return len(self._tag_of)
+
+    # ================= 查询 =================
+    def style_at(self, index):
+        """index 处字符的样式 dict"""
+        for tag in self.text.tag_names(index):
+            if tag in self._key_of:
+                return dict(self._key_of[tag])
+        return {}
+
+    def _runs(self, start, end):
+        """把 [start, end) 按样式标签切成连续段 [(起点, 终点, key), ...]"""
+        current = next((t for t in self.text.tag_names(start) if t in self._key_of), None)
+        pos = self.text.index(start)
+        runs = []
+        for kind, tag, index in self.text.dump(start, end, tag=True):
+            if tag not in self._key_of:
+                continue
+            if self.text.compare(index, ">", pos):
+                runs.append((pos, index, self._key_of.get(current)))
+                pos = index
+            if kind == "tagon":
+                current = tag
+            elif tag == current:
+                current = None
+        if self.text.compare(end, ">", pos):
+            runs.append((pos, self.text.index(end), self._key_of.get(current)))
+        return runs
+
+    # ================= 修改 =================
+    def apply(self, start, end, **changes):
+        """对 [start, end) 的每一段叠加 changes（值为 None / False 表示去掉该属性），相邻同样式段合并后一次打标签"""
+        runs = self._runs(start, end)
+        for tag in {self._tag_of[key] for _, _, key in runs if key}:
+            self.text.tag_remove(tag, start, end)
+        merged = []
+        for s, e, key in runs:
+            style = dict(key or ())
+            for attr, value in changes.items():
+                if value is None or value is False:
+                    style.pop(attr, None)
+                else:
+                    style[attr] = value
+            new = tuple(sorted(style.items()))
+            if merged and merged[-1][2] == new:
+                merged[-1][1] = e
+            else:
+                merged.append([s, e, new])
+        for s, e, key in merged:
+            if key:
+                self.text.tag_add(self.tag_for(key), s, e)
+        self.collect()
+
+    def toggle(self, start, end, attr):
+        """按选区首字符的状态整体开关某个布尔属性（粗体 / 斜体 / 下划线 / 删除线）"""
+        self.apply(start, end, **{attr: not self.style_at(start).get(attr)})
+
+    def tag_for(self, key):
+        tag = self._tag_of.get(key)
+        if tag is not None:
+            return tag
+        tag = f"{self.prefix}{self._seq}"
+        self._seq += 1
+        style = dict(key)
+        options = {}
+        if any(attr in style for attr in self.FONT_ATTRS):
+            options["font"] = self._acquire_font(self._font_key(style))
+        if style.get("underline"):
+            options["underline"] = True
+        if style.get("overstrike"):
+            options["overstrike"] = True
+        if "fg" in style:
+            options["foreground"] = style["fg"]
+        if "bg" in style:
+            options["background"] = style["bg"]
+        self.text.tag_config(tag, **options)
+        self.text.tag_lower(tag)  # 样式标签放在最底层，选区 / 段落标签始终覆盖在上面
+        self._tag_of[key] = tag
+        self._key_of[tag] = key
+        return tag
+
+    def collect(self):
+        """删除已不覆盖任何字符的样式标签（包括被编辑删光的），并释放对应的 Font"""
+        for tag, key in list(self._key_of.items()):
+            if not self.text.tag_nextrange(tag, "1.0"):
+                self.text.tag_delete(tag)
+                del self._key_of[tag]
+                del self._tag_of[key]
+                style = dict(key)
+                if any(attr in style for attr in self.FONT_ATTRS):
+                    self._release_font(self._font_key(style))
+
+    def clear(self):
+        for tag in self._key_of:
+            self.text.tag_delete(tag)
+        self._tag_of.clear()
+        self._key_of.clear()
+        self._fonts.clear()
+
+    # ================= Font 缓存 =================
+    def _font_key(self, style):
+        return (
+            style.get("family", self.base_family),
+            style.get("size", self.base_size),
+            bool(style.get("bold")),
+            bool(style.get("italic")),
+        )
+
+    def _acquire_font(self, key):
+        entry = self._fonts.get(key)
+        if entry is None:
+            family, size, bold, italic = key
+            f = tkfont.Font(
+                root=self.text,
+                family=family,
+                size=size,
+                weight="bold" if bold else "normal",
+                slant="italic" if italic else "roman",
+            )
+            entry = self._fonts[key] = [f, 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_font(self, key):
+        entry = self._fonts.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._fonts[key]
+
+
+class DocumentFile:
+    """
+    文档的打开 / 保存（纯文本）。
+    打开：mmap 映射文件（成功后才清空编辑区），按约 chunk_bytes 在换行处切块，用 after 分帧解码插入 Text，每帧不超过 slice_ms，
+    on_progress(已加载字节, 总字节) 报告进度，完成后调用 on_done(path)。每块起点放一个 mark。
+    保存：逐块取回文本与原文件比较，未改动的块直接从原文件拷贝（copy_file_range），只有改动的块重新编码写入；
+    写完临时文件后 os.replace 原子替换。同一路径且没有任何改动时不写盘。
+    解码 / 编码使用 surrogateescape，文件里的非法字节在编辑区中原样保留，保存时写回同样的字节。
+    """
+
+    MARK = "doc_chunk_"
+
+    def __init__(self, text, chunk_bytes, slice_ms, encoding="utf-8", on_progress=None, on_done=None):
+        self.text = text
+        self.chunk_bytes = chunk_bytes
+        self.slice_ms = slice_ms
+        self.encoding = encoding
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.path = None
+        self.spans = []  # 每块在原文件中的 (起, 止) 字节偏移，与 Text 中的 mark 一一对应
+        self.loading = False
+        self._file = None
+        self._map = None
+        self._next = 0
+        self._job = None
+        self._undo = True
+
+    # ================= 打开 =================
+    def open(self, path):
+        # 先映射新文件，打不开时抛出 OSError，当前文档保持不动
+        file, mapped, size = self._map_file(path)
+        self.cancel()
+        self._close_map()
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        self._clear_marks()
+
+        self._file, self._map = file, mapped
+        self.path = path
+        self.spans = self._split(size)
+
+        # 加载期间关闭撤销栈并禁止编辑，插入过程不进入 undo 历史
+        self._undo = self.text.cget("undo")
+        self.text.config(undo=False, state="disabled")
+        self.loading = True
+        self._next = 0
+        self._job = self.text.after(0, self._load_step)
+
+    def _split(self, size):
+        utf8 = codecs.lookup(self.encoding).name == "utf-8"
+        spans, pos = [], 0
+        while pos < size:
+            end = min(pos + self.chunk_bytes, size)
+            if end < size:
+                nl = self._map.rfind(b"\n", pos, end)
+                if nl >= 0:
+                    end = nl + 1
+                elif utf8:
+                    # 超长行：退到 UTF-8 字符边界，避免把一个字符切成两半
+                    while end > pos + 1 and self._map[end] & 0xC0 == 0x80:
+                        end -= 1
+                else:
+                    # 其他编码无法从中间判断字符边界，整行放进同一块
+                    nl = self._map.find(b"\n", end)
+                    end = size if nl < 0 else nl + 1
+            spans.append((pos, end))
+            pos = end
+        return spans
+
+    def _load_step(self):
+        self._job = None
+        deadline = time.perf_counter() + self.slice_ms / 1000
+        self.text.config(state="normal")
+        while self._next < len(self.spans):
+            a, b = self.spans[self._next]
+            mark = f"{self.MARK}{self._next}"
+            self.text.mark_set(mark, "end-1c")
+            self.text.mark_gravity(mark, "left")  # 块起点的 mark 不随本块插入的文字后移
+            self.text.insert("end-1c", self._map[a:b].decode(self.encoding, errors="surrogateescape"))
+            self._next += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.text.config(state="disabled")
+
+        if self.on_progress and self.spans:
+            self.on_progress(self.spans[self._next - 1][1], self.spans[-1][1])
+        if self._next < len(self.spans):
+            self._job = self.text.after(1, self._load_step)
+            return
+        self.loading = False
+        self.text.config(undo=self._undo, state="normal")
+        self.text.edit_reset()
+        self.text.edit_modified(False)
+        self.text.mark_set("insert", "1.0")
+        if self.on_done:
+            self.on_done(self.path)
+
+    def cancel(self):
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        if self.loading:
+            self.loading = False
+            self.text.config(undo=self._undo, state="normal")
+
+    # ================= 保存 =================
+    def save(self, path=None):
+        """返回重新编码写入的块数；同一路径且无改动时返回 0 且不写盘"""
+        if self.loading:
+            raise RuntimeError("文档仍在加载")
+        path = path or self.path
+        if not self.spans:
+            # 未从文件打开的文档：整篇作为一块
+            self.text.mark_set(f"{self.MARK}0", "1.0")
+            self.text.mark_gravity(f"{self.MARK}0", "left")
+            self.spans = [(0, 0)]
+
+        source = memoryview(self._map) if self._map is not None else None
+        chunks, changed = [], 0
+        for i, (a, b) in enumerate(self.spans):
+            start = "1.0" if i == 0 else f"{self.MARK}{i}"
+            end = f"{self.MARK}{i + 1}" if i + 1 < len(self.spans) else "end-1c"
+            data = self.text.get(start, end).encode(self.encoding, errors="surrogateescape")
+            if source is not None and b > a and source[a:b] == data:
+                chunks.append((a, b, None))
+            else:
+                chunks.append((a, b, data))
+                changed += 1
+        if source is not None:
+            source.release()
+        if not changed and path == self.path:
+            return 0
+
+        tmp = f"{path}.tmp"
+        spans, pos = [], 0
+        try:
+            with open(tmp, "wb", buffering=0) as out:
+                for a, b, data in chunks:
+                    if data is None:
+                        self._copy(out, a, b)
+                        size = b - a
+                    else:
+                        out.write(data)
+                        size = len(data)
+                    spans.append((pos, pos + size))
+                    pos += size
+                os.fsync(out.fileno())
+            self._close_map()  # Windows 上被映射的文件不能被替换
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if self._file is None and self.path:
+                self._file, self._map, _ = self._map_file(self.path)
+            raise
+
+        self.path = path
+        self.spans = spans
+        self._file, self._map, _ = self._map_file(path)
+        self.text.edit_modified(False)
+        return changed
+
+    def _copy(self, out, a, b):
+        if hasattr(os, "copy_file_range"):
+            try:
+                while a < b:
+                    n = os.copy_file_range(self._file.fileno(), out.fileno(), b - a, a)
+                    if n <= 0:
+                        break
+                    a += n
+            except OSError:
+                pass  # 跨文件系统等不支持的情况，剩余部分退回普通写入
+        if a < b:
+            out.write(self._map[a:b])
+
+    @staticmethod
+    def _map_file(path):
+        """返回 (文件对象, mmap 或 None, 字节数)"""
+        file = open(path, "rb")
+        try:
+            size = os.fstat(file.fileno()).st_size
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None  # 空文件不能 mmap
+        except (OSError, ValueError):
+            file.close()
+            raise
+        return file, mapped, size
+
+    # ================= 清理 =================
+    def _clear_marks(self):
+        for mark in self.text.mark_names():
+            if mark.startswith(self.MARK):
+                self.text.mark_unset(mark)
+        self.spans = []
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self.cancel()
+        self._close_map()
@@ -0,0 +1,191 @@
+# console.py
+# (工具层)：CMD 视图中 python 模式的解释器
+# 在独立子进程中执行用户代码，通过管道逐段回传输出，不会卡住 Tk 主线程
+# 直接运行本文件即为子进程端 (worker)
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+
+class PythonConsole:
+    """
+    父进程端。所有回调都通过 post(fn, *args) 投递，由调用方切回 Tk 主线程执行:
+      on_output(text, is_err)  子进程的 stdout / stderr 输出
+      on_result(more, stats)   一次 push 结束；more 表示语句未完成，stats 为耗时/内存统计
+      on_exit()                子进程退出（例如用户调用了 sys.exit()）
+    """
+
+    def __init__(self, post, on_output, on_result, on_exit):
+        self.post = post
+        self.on_output = on_output
+        self.on_result = on_result
+        self.on_exit = on_exit
+        self.proc = None
+        self.pending = 0  # 已发送但尚未返回结果的 push 数
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        if self.alive:
+            return
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **kwargs,
+        )
+        self.pending = 0
+        threading.Thread(target=self._read_events, args=(self.proc,), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.proc,), daemon=True).start()
+
+    def push(self, line):
+        """发送一行源码，结果通过 on_result 异步返回"""
+        if not self.alive:
+            self.start()
+        self.pending += 1
+        try:
+            self.proc.stdin.write((json.dumps({"src": line}) + "\n").encode("ascii"))
+            self.proc.stdin.flush()
+        except OSError:
+            self.pending = 0
+            self.post(self.on_exit)
+
+    def interrupt(self):
+        """向正在执行的代码发送 KeyboardInterrupt"""
+        if not (self.alive and self.busy):
+            return False
+        try:
+            if sys.platform == "win32":
+                os.kill(self.proc.pid, signal.CTRL_BREAK_EVENT)
+            else:
+                os.kill(self.proc.pid, signal.SIGINT)
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        self.pending = 0
+        if proc and proc.poll() is None:
+            try:
+                proc.stdin.close()
+                proc.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                proc.kill()
+
+    def _read_events(self, proc):
+        for raw in iter(proc.stdout.readline, b""):
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            if event["t"] == "out":
+                self.post(self.on_output, event["s"], event["err"])
+            elif event["t"] == "done":
+                self.post(self._done, proc, event["more"], event.get("stats"))
+        self.post(self._exited, proc)
+
+    def _read_stderr(self, proc):
+        # 子进程自身崩溃时的输出（用户代码的 stderr 已走事件通道）
+        for raw in iter(proc.stderr.readline, b""):
+            self.post(self.on_output, raw.decode("utf-8", errors="replace"), True)
+
+    def _done(self, proc, more, stats):
+        if proc is self.proc:
+            self.pending = max(0, self.pending - 1)
+            self.on_result(more, stats)
+
+    def _exited(self, proc):
+        if proc is self.proc:
+            self.proc = None
+            self.pending = 0
+            self.on_exit()
+
+
+# ================= 子进程端 =================
+class _PipeWriter:
+    """替换子进程的 sys.stdout / sys.stderr，每次 write 都作为一个事件发回父进程"""
+
+    def __init__(self, send, is_err):
+        self.send = send
+        self.is_err = is_err
+
+    def write(self, text):
+        if text:
+            self.send({"t": "out", "s": text, "err": self.is_err})
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _worker_main():
+    import code
+    import time
+    import tracemalloc
+
+    channel = sys.stdout
+    lock = threading.Lock()  # 用户代码可能在其他线程里 print
+
+    def send(event):
+        data = json.dumps(event) + "\n"
+        with lock:
+            channel.write(data)
+            channel.flush()
+
+    sys.stdout = _PipeWriter(send, False)
+    sys.stderr = _PipeWriter(send, True)
+
+    if sys.platform == "win32":
+        # CTRL_BREAK_EVENT 默认会结束进程，这里改为抛出 KeyboardInterrupt
+        def _on_break(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGBREAK, _on_break)
+
+    console = code.InteractiveConsole({"__name__": "__console__", "__doc__": None})
+    tracemalloc.start()
+    stdin = sys.stdin
+
+    while True:
+        try:
+            line = stdin.readline()
+            if not line:
+                break
+            src = json.loads(line)["src"]
+            executes = bool(src.strip() or console.buffer)  # 空行也可能结束一个代码块
+            tracemalloc.reset_peak()
+            mem_before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                more = console.push(src)
+            except KeyboardInterrupt:
+                console.write("\nKeyboardInterrupt\n")
+                console.resetbuffer()
+                more = False
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            stats = None
+            if not more and executes:
+                stats = {"elapsed": elapsed, "delta": current - mem_before, "peak": peak - mem_before}
+            send({"t": "done", "more": more, "stats": stats})
+        except KeyboardInterrupt:
+            # 中断信号晚到（代码已执行完），忽略
+            continue
+
+
+if __name__ == "__main__":
+    _worker_main()
@@ -0,0 +1,266 @@
+# contacts.py
+# (模型层)：联系人目录
+# 持有联系人列表并维护 id / ip / (ip, port) 哈希索引和搜索用的 n-gram 索引，
+# 以及侧栏的显示模型（按最近活动排序 + 未读数）
+from bisect import bisect_left
+from collections import defaultdict
+
+_MAX_GRAM = 3  # 索引所有长度 1~3 的子串，更长的查询取 3-gram 交集后再校验
+
+
+def _grams(text, n):
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+class ContactDirectory:
+    """联系人目录：增删改查均为 O(1)，变更通过 subscribe 的回调通知界面增量更新"""
+
+    def __init__(self, contacts=()):
+        self._contacts = {}  # id -> contact，保持插入顺序
+        self._order = {}  # id -> 插入序号，用于搜索结果排序
+        self._seq = 0
+        self._by_ip = defaultdict(list)  # ip -> [contact, ...]
+        self._by_addr = {}  # (ip, port) -> contact
+        self._grams = defaultdict(set)  # n-gram -> {id, ...}
+        self._listeners = []
+        for c in contacts:
+            self.add(c, notify=False)
+
+    # ================= 查询 =================
+    def __iter__(self):
+        return iter(self._contacts.values())
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def all(self):
+        return list(self._contacts.values())
+
+    def get(self, contact_id):
+        return self._contacts.get(contact_id)
+
+    def by_ip(self, ip):
+        bucket = self._by_ip.get(ip)
+        return bucket[0] if bucket else None
+
+    def by_addr(self, ip, port):
+        return self._by_addr.get((ip, port))
+
+    def order_of(self, contact_id):
+        return self._order[contact_id]
+
+    def name_for(self, ip, default=None):
+        c = self.by_ip(ip)
+        return c["name"] if c else default
+
+    def search(self, query):
+        """按名称或 IP 子串搜索，结果保持目录顺序"""
+        query = query.lower().strip()
+        if not query:
+            return self.all()
+        if len(query) <= _MAX_GRAM:
+            ids = self._grams.get(query, set())
+        else:
+            ids = None
+            for g in _grams(query, _MAX_GRAM):
+                ids = self._grams.get(g, set()) if ids is None else ids & self._grams.get(g, set())
+                if not ids:
+                    return []
+            ids = [i for i in ids if self._matches(self._contacts[i], query)]
+        return [self._contacts[i] for i in sorted(ids, key=self._order.__getitem__)]
+
+    @staticmethod
+    def _matches(contact, query):
+        return query in contact["name"].lower() or query in contact["ip"]
+
+    def matches(self, contact, query):
+        query = query.lower().strip()
+        return not query or self._matches(contact, query)
+
+    # ================= 变更 =================
+    def subscribe(self, callback):
+        """callback(event, contact)，event 为 "add" / "update" / "remove" """
+        self._listeners.append(callback)
+
+    def _notify(self, event, contact):
+        for cb in self._listeners:
+            cb(event, contact)
+
+    def new_id(self):
+        while str(self._seq) in self._contacts:
+            self._seq += 1
+        return str(self._seq)
+
+    def add(self, contact, notify=True):
+        if not contact.get("id") or contact["id"] in self._contacts:
+            contact["id"] = self.new_id()
+        self._contacts[contact["id"]] = contact
+        self._order[contact["id"]] = self._seq
+        self._seq += 1
+        self._index(contact)
+        if notify:
+            self._notify("add", contact)
+        return contact
+
+    def update(self, contact_id, **fields):
+        contact = self._contacts.get(contact_id)
+        if contact is None:
+            return None
+        self._unindex(contact)
+        contact.update(fields)
+        self._index(contact)
+        self._notify("update", contact)
+        return contact
+
+    def remove(self, contact_id):
+        contact = self._contacts.pop(contact_id, None)
+        if contact is None:
+            return None
+        self._order.pop(contact_id, None)
+        self._unindex(contact)
+        self._notify("remove", contact)
+        return contact
+
+    # ================= 索引维护 =================
+    def _keys(self, contact):
+        keys = set()
+        for text in (contact["name"].lower(), contact["ip"]):
+            for n in range(1, _MAX_GRAM + 1):
+                keys |= _grams(text, n)
+        return keys
+
+    def _index(self, contact):
+        self._by_ip[contact["ip"]].append(contact)
+        self._by_addr.setdefault((contact["ip"], contact["port"]), contact)
+        for g in self._keys(contact):
+            self._grams[g].add(contact["id"])
+
+    def _unindex(self, contact):
+        bucket = self._by_ip.get(contact["ip"], [])
+        if contact in bucket:
+            bucket.remove(contact)
+        if not bucket:
+            self._by_ip.pop(contact["ip"], None)
+        addr = (contact["ip"], contact["port"])
+        if self._by_addr.get(addr) is contact:
+            del self._by_addr[addr]
+            other = next((c for c in bucket if c["port"] == contact["port"]), None)
+            if other:
+                self._by_addr[addr] = other
+        for g in self._keys(contact):
+            ids = self._grams.get(g)
+            if ids:
+                ids.discard(contact["id"])
+                if not ids:
+                    del self._grams[g]
+
+
+class SidebarModel:
+    """
+    侧栏显示模型：rows 为当前显示的联系人，按最近活动时间排序（最新在上，没有活动的按目录顺序排在后面）。
+    rows 旁边维护一份同序的排序键列表，定位 / 移动一行都用 bisect，O(log n) 找到位置；
+    每次变更只通过 listener(op, idx, contact, unread) 通知受影响的行:
+      "insert" / "update" / "remove" 时 idx 为行号，"move" 时 idx 为 (旧行号, 新行号)
+    """
+
+    def __init__(self, directory, activity=None):
+        self.directory = directory
+        self.rows = []
+        self._keys = []  # 与 rows 同序的排序键 (-最近活动时间, 目录序号)，保证唯一
+        self._key_of = {}  # 显示中的 id -> 排序键，联系人已从目录删除时仍能找到所在行
+        self.activity = dict(activity or {})  # id -> 最近一条消息的 ts
+        self.unread = {}  # id -> 未读数，0 不存
+        self.query = ""
+        self.listener = None
+        self.rows[:] = sorted(directory, key=self._key)
+        self._keys[:] = [self._key(c) for c in self.rows]
+        self._key_of.update(zip((c["id"] for c in self.rows), self._keys))
+
+    def _key(self, contact):
+        return (-self.activity.get(contact["id"], 0.0), self.directory.order_of(contact["id"]))
+
+    def _emit(self, op, idx, contact):
+        if self.listener:
+            self.listener(op, idx, contact, self.unread.get(contact["id"], 0))
+
+    def index(self, contact):
+        key = self._key_of.get(contact["id"])
+        return None if key is None else bisect_left(self._keys, key)
+
+    def unread_for(self, contact):
+        return self.unread.get(contact["id"], 0)
+
+    # ================= 行操作 =================
+    def _insert(self, contact):
+        key = self._key(contact)
+        idx = bisect_left(self._keys, key)
+        self._keys.insert(idx, key)
+        self.rows.insert(idx, contact)
+        self._key_of[contact["id"]] = key
+        self._emit("insert", idx, contact)
+
+    def _remove(self, contact):
+        idx = bisect_left(self._keys, self._key_of.pop(contact["id"]))
+        del self._keys[idx]
+        del self.rows[idx]
+        self._emit("remove", idx, contact)
+
+    # ================= 事件 =================
+    def filter(self, query):
+        """按搜索词重设显示集合；新旧列表同一排序，只对差异行做删除/插入"""
+        self.query = query
+        target = sorted(self.directory.search(query), key=self._key)
+        keep = {c["id"] for c in target}
+        for c in [c for c in self.rows if c["id"] not in keep]:
+            self._remove(c)
+        for c in target:
+            if c["id"] not in self._key_of:
+                self._insert(c)
+
+    def touch(self, contact, ts):
+        """联系人有新消息：更新活动时间，只移动这一行"""
+        cid = contact["id"]
+        if ts <= self.activity.get(cid, 0.0):
+            return
+        old_key = self._key_of.get(cid)
+        self.activity[cid] = ts
+        if old_key is None:
+            return
+        old = bisect_left(self._keys, old_key)
+        del self._keys[old]
+        del self.rows[old]
+        key = self._key(contact)
+        new = bisect_left(self._keys, key)
+        self._keys.insert(new, key)
+        self.rows.insert(new, contact)
+        self._key_of[cid] = key
+        if new == old:
+            self._emit("update", new, contact)
+        else:
+            self._emit("move", (old, new), contact)
+
+    def set_unread(self, contact, count):
+        cid = contact["id"]
+        if count == self.unread.get(cid, 0):
+            return
+        if count:
+            self.unread[cid] = count
+        else:
+            self.unread.pop(cid, None)
+        idx = self.index(contact)
+        if idx is not None:
+            self._emit("update", idx, contact)
+
+    def on_contact_changed(self, event, contact):
+        """ContactDirectory 变更回调"""
+        shown = contact["id"] in self._key_of
+        visible = event != "remove" and self.directory.matches(contact, self.query)
+        if shown and not visible:
+            self._remove(contact)
+        elif shown:
+            self._emit("update", self.index(contact), contact)
+        elif visible:
+            self._insert(contact)
+        if event == "remove":
+            self.activity.pop(contact["id"], None)
+            self.unread.pop(contact["id"], None)
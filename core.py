@@ -0,0 +1,405 @@
+# core.py
+# (引擎层)：不依赖界面的聊天核心
+# 负责网络收发、聊天记录、联系人；界面、脚本、压测都通过 subscribe 订阅事件来驱动
+# 不导入 tkinter，可单独作为守护进程运行: python core.py
+import itertools
+import queue
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from settings import CONTACTS, PORT, RECV_QUEUE_SIZE, RECV_BATCH_MAX, RECV_SOCKET_BUFFER, CHUNK_SIZE, REASSEMBLY_TIMEOUT
+from settings import COMPRESS_THRESHOLD, COMPRESS_LEVEL, RECV_POOL_SIZE, FRAME_UNKNOWN_PEERS
+from settings import NETWORK_ENGINE, RELIABLE_MODE, RELIABLE_OPTIONS, HISTORY_DB, HISTORY_LOAD_LIMIT
+from settings import HISTORY_RING_SIZE, HISTORY_MEMORY_CAP, HISTORY_PAGE_SIZE, HISTORY_SEARCH_SCAN
+from settings import DISCOVERY_ENABLED, LOCAL_NAME, MULTICAST_GROUP, MULTICAST_PORT, MULTICAST_TTL
+from settings import BEACON_INTERVAL, PEER_EXPIRY, GROUP_NAME
+from network import CommManager
+from history import HistoryStore, Conversation, Record
+from contacts import ContactDirectory
+from instrumentation import stats
+
+
+class ChatCore:
+    """
+    事件（回调在调用 process_pending / send 的线程中同步触发）:
+      "messages" (batch)               batch = [(ip, 发送者名称, record), ...]，本轮收到并已入库的消息
+      "unread"   (changes)             changes = {ip: 未读条数}，只包含本轮有变化的会话
+      "status"   (ip, record, status)  可靠模式下自己发出的消息送达 / 失败
+      "contact"  (event, contact)      联系人增删改，event 为 "add" / "update" / "remove"
+    群聊消息以组播地址作为 ip，和单聊消息一样出现在 "messages" 事件中，正文为 "发送者: 内容"
+
+    接收流水线（每一段的耗时记入 instrumentation 的 pipeline.*）:
+      decode   网络线程      分帧重组、解压、UTF-8 解码 (CommManager)
+      resolve  流水线线程    校验正文、解析发送者名称
+      build    流水线线程    生成记录
+      remember 调用方线程    按到达顺序追加到内存中的会话并交给 HistoryStore 落盘
+                             （发出的消息也在这个线程记录，会话顺序、时间戳顺序与数据库顺序一致）
+      unread   调用方线程    非当前会话的未读计数
+      notify   调用方线程    发出 "messages" / "unread" 事件
+    """
+
+    def __init__(
+        self,
+        port=PORT,
+        contacts=CONTACTS,
+        history_path=HISTORY_DB,
+        engine=NETWORK_ENGINE,
+        reliable=RELIABLE_MODE,
+        discovery=DISCOVERY_ENABLED,
+    ):
+        self._listeners = defaultdict(list)
+        self._status_events = queue.SimpleQueue()  # 网络线程 -> 调用方线程
+
+        # 局域网发现与群聊：start() 时加入组播组
+        self.discovery = None
+        self._discovery_wanted = discovery
+        self._discovery_events = queue.SimpleQueue()  # 组播接收线程 -> 调用方线程
+        self.group_addr = (MULTICAST_GROUP, MULTICAST_PORT)
+        self._seen = {}  # 联系人 id -> 最近一次收到信标的时间
+        self._last_expire = 0.0
+        self._last_reply = 0.0
+
+        # 接收流水线：流水线线程处理好的批次放入 _ready，由 process_pending 取走
+        self._ready = queue.SimpleQueue()
+        self._worker = None
+        self.unread = defaultdict(int)  # ip -> 未读条数
+        self.active_ip = None  # 界面当前打开的会话，收到它的消息不计未读
+        self._minute = None  # (分钟数, "HH:MM")，同一分钟内的记录复用时间字符串
+
+        # 联系人目录：按 id / ip 建立哈希索引
+        self.contacts = ContactDirectory(contacts)
+        self.contacts.subscribe(lambda event, contact: self.emit("contact", event, contact))
+
+        # 聊天记录: { ip: Conversation }，每个会话内存中只保留最近的记录，全部记录由 HistoryStore 持久化
+        self.history = HistoryStore(history_path, scan_limit=HISTORY_SEARCH_SCAN)
+        self.chat_history = self.history.load_all_recent(HISTORY_LOAD_LIMIT)
+        self._history_bytes = sum(c.nbytes for c in self.chat_history.values())
+        self._activity = itertools.count(1)
+
+        self.reliable = reliable
+        network_cls = CommManager
+        if engine == "asyncio":
+            from async_network import AsyncCommManager
+
+            network_cls = AsyncCommManager
+        # 收到的消息先进入网络层的有界队列，由 process_pending 批量取走
+        self.network = network_cls(
+            port,
+            None,
+            batch_mode=True,
+            queue_size=RECV_QUEUE_SIZE,
+            chunk_size=CHUNK_SIZE,
+            rcvbuf=RECV_SOCKET_BUFFER,
+            reassembly_timeout=REASSEMBLY_TIMEOUT,
+            reliable=reliable,
+            on_status=lambda token, status: self._status_events.put((token, status)),
+            reliable_options=RELIABLE_OPTIONS,
+            compress_threshold=COMPRESS_THRESHOLD,
+            compress_level=COMPRESS_LEVEL,
+            pool_size=RECV_POOL_SIZE,
+            frame_unknown_peers=FRAME_UNKNOWN_PEERS,
+        )
+
+        # 统计读数：只在查看时求值
+        stats.gauge("net.dropped", lambda: self.network.total("dropped"))
+        stats.gauge("net.expired", lambda: self.network.total("expired_messages"))
+        if reliable:
+            stats.gauge("net.retransmits", lambda: self.network.reliable.retransmits)
+        stats.gauge("net.decode_errors", lambda: self.network.total("decode_errors"))
+        stats.gauge("net.compress_ratio", lambda: round(self.network.bytes_wire / self.network.bytes_raw, 3) if self.network.bytes_raw else 1.0)
+        stats.gauge("history.bytes", self.history_memory)
+
+    # ================= 生命周期 =================
+    def start(self):
+        """启动网络，成功返回 True，失败返回错误信息；组播不可用时只打印提示，单聊照常工作"""
+        err = self.network.start()
+        if err is not True:
+            return err
+        self._worker = threading.Thread(target=self._pipeline_worker, daemon=True)
+        self._worker.start()
+        if not self._discovery_wanted:
+            return True
+        from discovery import Discovery
+
+        self.discovery = Discovery(
+            MULTICAST_GROUP,
+            MULTICAST_PORT,
+            LOCAL_NAME or socket.gethostname(),
+            self.network.sock.getsockname()[1],
+            lambda kind, info, addr: self._discovery_events.put((kind, info, addr)),
+            interval=BEACON_INTERVAL,
+            ttl=MULTICAST_TTL,
+            chunk_size=CHUNK_SIZE,
+        )
+        derr = self.discovery.start()
+        if derr is not True:
+            print(f"Discovery Disabled: {derr}")
+            self.discovery = None
+        elif self.contacts.by_addr(*self.group_addr) is None:
+            self.contacts.add({"id": "group", "name": GROUP_NAME, "ip": MULTICAST_GROUP, "port": MULTICAST_PORT, "group": True})
+        return True
+
+    @property
+    def running(self):
+        return self.network.running
+
+    def close(self):
+        if self.discovery:
+            self.discovery.close()
+        self.network.close()
+        self.history.close()
+
+    def run(self, interval=0.05):
+        """守护进程模式：在当前线程循环处理收到的消息，直到 close()"""
+        while self.running:
+            self.process_pending()
+            time.sleep(interval)
+
+    # ================= 事件 =================
+    def subscribe(self, event, callback):
+        self._listeners[event].append(callback)
+
+    def emit(self, event, *args):
+        for cb in self._listeners[event]:
+            cb(*args)
+
+    # ================= 收发 =================
+    def process_pending(self, max_items=None):
+        """取走网络层排队的消息与投递状态，入库后一次性发出事件；返回处理的消息条数"""
+        while True:
+            try:
+                (ip, record), status = self._status_events.get_nowait()
+            except queue.Empty:
+                break
+            record["status"] = status
+            self.history.update_status(record.id, status)
+            self.emit("status", ip, record, status)
+
+        received = self._process_discovery() if self.discovery else []
+        start = time.perf_counter()
+        while max_items is None or len(received) < max_items:
+            try:
+                batch = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            for ip, name, record in batch:
+                self._remember(ip, record)
+            received.extend(batch)
+        if not received:
+            return 0
+        t_remember = time.perf_counter()
+
+        changes = {}
+        for ip, _, _ in received:
+            if ip != self.active_ip:
+                self.unread[ip] += 1
+                changes[ip] = self.unread[ip]
+        t_unread = time.perf_counter()
+
+        stats.mark("recv.messages", len(received))
+        self.emit("messages", received)
+        if changes:
+            self.emit("unread", changes)
+        t_notify = time.perf_counter()
+
+        stats.observe("pipeline.remember", (t_remember - start) * 1000)
+        stats.observe("pipeline.unread", (t_unread - t_remember) * 1000)
+        stats.observe("pipeline.notify", (t_notify - t_unread) * 1000)
+        return len(received)
+
+    def set_active(self, ip):
+        """界面切换会话时调用：清零该会话的未读数"""
+        self.active_ip = ip
+        if self.unread.pop(ip, 0):
+            self.emit("unread", {ip: 0})
+
+    # ================= 接收流水线（流水线线程）=================
+    def _pipeline_worker(self):
+        inbox = self.network.inbox
+        while self.network.running:
+            try:
+                first = inbox.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            batch = [first] + self.network.drain(RECV_BATCH_MAX - 1)
+            start = time.perf_counter()
+            resolved = self._stage_resolve(batch)
+            t_resolve = time.perf_counter()
+            built = self._stage_build(resolved)
+            t_build = time.perf_counter()
+            stats.observe("pipeline.resolve", (t_resolve - start) * 1000)
+            stats.observe("pipeline.build", (t_build - t_resolve) * 1000)
+            if built:
+                self._ready.put(built)
+
+    def _stage_resolve(self, batch):
+        """校验正文并解析发送者：[(msg, ip), ...] -> [(ip, 名称, msg), ...]"""
+        resolved = []
+        for msg, ip in batch:
+            msg = msg.replace("\r\n", "\n")
+            if not msg.strip():
+                continue  # 空消息不入库
+            try:
+                name = self.contacts.name_for(ip, ip)
+            except IndexError:
+                name = ip  # 联系人正在被界面线程删除
+            resolved.append((ip, name, msg))
+        return resolved
+
+    def _stage_build(self, resolved):
+        """生成记录：[(ip, 名称, msg), ...] -> [(ip, 名称, record), ...]；落盘在 _remember 中按到达顺序进行"""
+        return [(ip, name, self._new_record("peer", msg)) for ip, name, msg in resolved]
+
+    def send(self, addr, msg):
+        """发送一条聊天消息并写入记录，返回该记录"""
+        if self.discovery and addr is not None and tuple(addr) == self.group_addr:
+            # 群聊：组播一次送达全组，不做可靠投递
+            record = self.record_message(addr[0], "self", msg)
+            self.discovery.send_group(msg)
+            stats.mark("send.messages")
+            return record
+        # 先存后发：可靠模式下记录作为 token 随消息发出，送达/失败时回写状态
+        record = self.record_message(addr[0], "self", msg, "pending" if self.reliable else None)
+        self.network.send(msg, addr, token=(addr[0], record))
+        stats.mark("send.messages")
+        return record
+
+    def send_raw(self, msg, addr):
+        """只发送不记录（例如 CMD 模式下的非白名单命令）"""
+        if addr is None:
+            return  # 还没有选择联系人
+        if self.discovery and tuple(addr) == self.group_addr:
+            self.discovery.send_group(msg)
+            return
+        self.network.send(msg, addr)
+
+    # ================= 局域网发现 =================
+    def _process_discovery(self):
+        """处理组播事件：信标增改联系人、群聊消息入库；返回本轮收到的群聊消息 [(ip, 名称, record), ...]"""
+        now = time.monotonic()
+        received = []
+        while True:
+            try:
+                kind, info, addr = self._discovery_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "presence":
+                self._on_presence(addr[0], info, now)
+            elif kind == "bye":
+                contact = self.contacts.by_addr(addr[0], info.get("port", PORT))
+                if contact and contact.get("auto"):
+                    self._seen.pop(contact["id"], None)
+                    self.contacts.remove(contact["id"])
+            elif kind == "group" and isinstance(info.get("msg"), str):
+                sender = str(info.get("name") or addr[0])
+                group_ip = self.group_addr[0]
+                record = self.record_message(group_ip, "peer", f"{sender}: {info['msg']}")
+                received.append((group_ip, self.contacts.name_for(group_ip, GROUP_NAME), record))
+
+        if now - self._last_expire > 1.0:
+            self._last_expire = now
+            for contact_id, seen in list(self._seen.items()):
+                if now - seen > PEER_EXPIRY:
+                    del self._seen[contact_id]
+                    contact = self.contacts.get(contact_id)
+                    if contact and contact.get("auto"):
+                        self.contacts.remove(contact_id)
+        return received
+
+    def _on_presence(self, ip, info, now):
+        try:
+            port = int(info.get("port", PORT))
+        except (TypeError, ValueError):
+            return
+        name = str(info.get("name") or ip)[:64]
+        contact = self.contacts.by_addr(ip, port)
+        if contact is None:
+            # 新上线的实例：加入联系人，并立即回一个信标让对方也尽快发现本机（每秒最多一次）
+            contact = self.contacts.add({"id": "", "name": name, "ip": ip, "port": port, "auto": True})
+            if now - self._last_reply > 1.0:
+                self._last_reply = now
+                self.discovery.announce()
+        elif contact.get("auto") and contact["name"] != name:
+            self.contacts.update(contact["id"], name=name)
+        self._seen[contact["id"]] = now
+        self.network.mark_framed((ip, port))  # 能发信标的都是新版本，直接使用分帧协议
+
+    # ================= 搜索 =================
+    def search_history(self, query, limit=50):
+        """全文搜索所有联系人的聊天记录，返回 [(ip, id, record), ...]，最新的在前"""
+        return self.history.search(query, limit)
+
+    def locate(self, ip, rowid, record):
+        """搜索结果在 history_for(ip) 中的下标"""
+        return self.history.position(ip, record["ts"], rowid)
+
+    # ================= 记录 =================
+    def record_message(self, ip, msg_type, msg, status=None):
+        # 写入内存记录并交给 HistoryStore 后台落盘
+        record = self._new_record(msg_type, msg, status)
+        self._remember(ip, record)
+        return record
+
+    def _new_record(self, msg_type, msg, status=None):
+        now = time.time()
+        minute = int(now // 60)
+        if self._minute is None or self._minute[0] != minute:
+            self._minute = (minute, datetime.fromtimestamp(now).strftime("%H:%M"))
+        return Record(msg_type, msg, self._minute[1], now, status)
+
+    def _remember(self, ip, record):
+        # 追加到内存中的会话（必要时把时间戳拉平到上一条）后再入库，超出环形缓冲或总内存上限时淘汰旧记录
+        conv = self.history_for(ip)
+        conv.last_active = next(self._activity)
+        self._history_bytes += conv.append(record)
+        self.history.append(ip, record)
+        if conv.in_memory > HISTORY_RING_SIZE:
+            self._history_bytes -= conv.evict(HISTORY_RING_SIZE)
+        if self._history_bytes > HISTORY_MEMORY_CAP:
+            self._enforce_memory_cap()
+
+    def _enforce_memory_cap(self):
+        # 从最久未活跃的会话开始淘汰，每个会话至少留一页；降到上限的 90% 再停，避免每条消息都触发
+        target = HISTORY_MEMORY_CAP * 0.9
+        for conv in sorted(self.chat_history.values(), key=lambda c: c.last_active):
+            if self._history_bytes <= target:
+                break
+            self._history_bytes -= conv.evict(HISTORY_PAGE_SIZE)
+
+    def history_memory(self):
+        """内存中聊天记录的近似字节数"""
+        return self._history_bytes
+
+    def history_for(self, ip):
+        # 同一联系人始终返回同一个 Conversation，调用方持有的引用会看到后续追加的记录
+        conv = self.chat_history.get(ip)
+        if conv is None:
+            conv = self.chat_history[ip] = Conversation(self.history, ip)
+        return conv
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="无界面运行聊天引擎")
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    core = ChatCore(port=args.port)
+    core.subscribe(
+        "messages",
+        lambda batch: [print(f"[{name} {rec['time']}] {rec['msg']}") for ip, name, rec in batch],
+    )
+    err = core.start()
+    if err is not True:
+        raise SystemExit(f"Port {args.port} failed: {err}")
+    print(f"chat core listening on udp/{args.port}, Ctrl+C to stop")
+    try:
+        core.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        core.close()
@@ -0,0 +1,118 @@
+# discovery.py
+# (网络层)：局域网在线发现与群聊
+# 所有实例加入同一个组播组：定期发送在线信标 (presence)，收到信标的一方自动加入联系人；
+# 群聊消息发往组播地址，一个数据报即送达全组，不再逐个单播
+import itertools
+import json
+import random
+import socket
+import struct
+import threading
+import uuid
+
+import protocol
+from network import MAX_DATAGRAM
+
+
+class Discovery:
+    """
+    组播报文为分帧后的 JSON（沿用 protocol 的帧头，长群聊消息同样分片重组）:
+      {"kind": "presence", "id": 实例 id, "name": 显示名, "port": 聊天端口}
+      {"kind": "bye",      "id": ..., "port": ...}      退出时发送，对方立即移除
+      {"kind": "group",    "id": ..., "name": ..., "msg": 文本}
+    on_event(kind, info, addr) 在接收线程中调用，调用方负责转回自己的线程
+    """
+
+    def __init__(self, group, port, name, chat_port, on_event, interval=5.0, ttl=1, chunk_size=1400):
+        self.group = group
+        self.port = port
+        self.name = name
+        self.chat_port = chat_port
+        self.on_event = on_event
+        self.interval = interval
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.instance = uuid.uuid4().hex[:12]  # 过滤组播回环收到的自己的报文
+
+        self.sock = None
+        self.running = False
+        self._stop = threading.Event()
+        self._msg_ids = itertools.count(random.randrange(1 << 31))
+        self.reassembler = protocol.Reassembler()
+
+    def start(self):
+        """加入组播组并开始发送信标，成功返回 True，失败返回错误信息（例如没有可用的组播路由）"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            # 同一台机器上的多个实例共用组播端口
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(("", self.port))
+            mreq = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            sock.settimeout(1.0)
+        except OSError as e:
+            return str(e)
+        self.sock = sock
+        self.running = True
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        threading.Thread(target=self._beacon_loop, daemon=True).start()
+        return True
+
+    # ================= 发送 =================
+    def _send(self, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        try:
+            for datagram in protocol.fragment(data, next(self._msg_ids) & 0xFFFFFFFF, self.chunk_size):
+                self.sock.sendto(datagram, (self.group, self.port))
+        except OSError as e:
+            print(f"Multicast Send Error: {e}")
+
+    def announce(self):
+        self._send({"kind": "presence", "id": self.instance, "name": self.name, "port": self.chat_port})
+
+    def send_group(self, msg):
+        self._send({"kind": "group", "id": self.instance, "name": self.name, "msg": msg})
+
+    def _beacon_loop(self):
+        while not self._stop.is_set():
+            self.announce()
+            self._stop.wait(self.interval)
+
+    # ================= 接收 =================
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                self.reassembler.expire()
+                continue
+            except OSError:
+                if not self.running:
+                    break
+                continue
+            frame = protocol.parse(data)
+            if frame is None:
+                continue  # 组播端口上的其他流量
+            flags, msg_id, seq, total, body = frame
+            payload = self.reassembler.feed(addr, msg_id, seq, total, body)
+            if payload is None:
+                continue
+            try:
+                info = json.loads(payload.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                continue
+            if not isinstance(info, dict) or info.get("id") == self.instance:
+                continue
+            self.on_event(info.get("kind"), info, addr)
+
+    def close(self):
+        if not self.running:
+            return
+        self._send({"kind": "bye", "id": self.instance, "port": self.chat_port})
+        self.running = False
+        self._stop.set()
+        self.sock.close()
@@ -0,0 +1,102 @@
+# executor.py
+# (工具层)：在后台线程执行 shell 命令
+# 输出逐行回传给界面，支持取消 (Ctrl+C) 和超时
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+
+class CommandRunner:
+    """
+    一次只运行一条命令。所有回调都通过 post(fn, *args) 投递，
+    由调用方负责切回 Tk 主线程执行。
+    """
+
+    def __init__(self, post, on_output, on_done, timeout=30, encoding="utf-8"):
+        self.post = post
+        self.on_output = on_output  # on_output(line, is_err)
+        self.on_done = on_done  # on_done(returncode, reason)，reason: None / "timeout" / "cancelled" / 错误信息
+        self.timeout = timeout
+        self.encoding = encoding
+        self.proc = None
+        self._reason = None
+
+    @property
+    def running(self):
+        return self.proc is not None
+
+    def run(self, cmd):
+        if self.running:
+            return False
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True  # 便于整组结束 shell 派生的子进程
+        try:
+            self.proc = subprocess.Popen(
+                cmd,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **kwargs,
+            )
+        except Exception as e:
+            self.proc = None
+            self.post(self.on_done, None, str(e))
+            return False
+        self._reason = None
+        readers = [
+            threading.Thread(target=self._pump, args=(self.proc.stdout, False), daemon=True),
+            threading.Thread(target=self._pump, args=(self.proc.stderr, True), daemon=True),
+        ]
+        for t in readers:
+            t.start()
+        threading.Thread(target=self._wait, args=(self.proc, readers), daemon=True).start()
+        return True
+
+    def _pump(self, stream, is_err):
+        for raw in iter(stream.readline, b""):
+            self.post(self.on_output, raw.decode(self.encoding, errors="replace"), is_err)
+        stream.close()
+
+    def _wait(self, proc, readers):
+        try:
+            proc.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self._reason = "timeout"
+            self._kill(proc)
+            proc.wait()
+        for t in readers:
+            t.join()
+        self.post(self._finish, proc.returncode)
+
+    def _finish(self, returncode):
+        self.proc = None
+        self.on_done(returncode, self._reason)
+
+    def cancel(self):
+        proc = self.proc
+        if proc is None:
+            return False
+        self._reason = "cancelled"
+        self._kill(proc)
+        return True
+
+    @staticmethod
+    def _kill(proc):
+        try:
+            if sys.platform == "win32":
+                # shell=True 时需要连同 cmd.exe 派生的子进程一起结束
+                subprocess.run(
+                    ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except (OSError, ProcessLookupError):
+            pass
@@ -0,0 +1,352 @@
+# history.py
+# (存储层)：聊天记录持久化
+# SQLite WAL 模式 + 后台写线程批量提交，界面线程只负责把记录丢进队列
+# 内存中每个联系人只保留最近一段记录 (Conversation)，更早的记录按需从数据库读回
+import itertools
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id   INTEGER PRIMARY KEY,
+    ip   TEXT NOT NULL,
+    ts   REAL NOT NULL,
+    type TEXT NOT NULL,
+    msg  TEXT NOT NULL,
+    time TEXT NOT NULL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_ip_ts ON messages (ip, ts);
+"""
+
+# 全文索引：FTS5 trigram 分词按 3 字切分，中文无需分词即可做子串检索；外部内容表，不重复存储正文
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE messages_fts USING fts5(msg, content='messages', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, msg) VALUES (new.id, new.msg);
+END;
+INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+"""
+
+# 二字索引：trigram 匹配不了 2 个字的查询（中文最常见的搜索长度），由写线程为每条记录拆出互不重复的相邻二字组合（小写）
+_BIGRAM_SCHEMA = """
+CREATE TABLE messages_bigram (
+    gram TEXT NOT NULL,
+    id   INTEGER NOT NULL,
+    PRIMARY KEY (gram, id)
+) WITHOUT ROWID;
+"""
+
+_STOP = object()
+_READ_FLUSH_TIMEOUT = 2.0  # 界面线程读库前等待写队列落盘的上限（秒），超时后直接读已落盘的部分
+
+
+class Record:
+    """
+    一条聊天记录。__slots__ 省掉每条记录的 __dict__，type / time 字符串驻留后所有记录共享同一份；
+    保留 rec["msg"] / rec.get("status") 的下标访问方式，视图代码无需改动。
+    id 为数据库主键，交给 HistoryStore.append 时分配
+    """
+
+    __slots__ = ("type", "msg", "time", "ts", "status", "id")
+
+    def __init__(self, type, msg, time, ts, status=None, id=None):
+        self.type = sys.intern(type)
+        self.msg = msg
+        self.time = sys.intern(time)
+        self.ts = ts
+        self.status = status
+        self.id = id
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def nbytes(self):
+        # time / type 是共享的驻留字符串，不计入
+        return sys.getsizeof(self) + sys.getsizeof(self.msg)
+
+
+class Conversation:
+    """
+    某个联系人的全部聊天记录，按时间正序，可像列表一样 len() / 下标 / 切片。
+    内存中只保留最近的一段 (环形缓冲)，更早的记录由 HistoryStore 按需读回；
+    下标是绝对位置（0 为最早的一条），淘汰内存记录不会改变已有下标，HistoryWindow 的 start / end 依然有效
+    """
+
+    def __init__(self, store, ip, records=(), total=None):
+        self.store = store
+        self.ip = ip
+        self._ring = deque(records)
+        self.base = (len(self._ring) if total is None else total) - len(self._ring)  # 已淘汰到磁盘的条数
+        self.nbytes = sum(r.nbytes() for r in self._ring)
+        self.last_active = 0
+
+    def __len__(self):
+        return self.base + len(self._ring)
+
+    def __iter__(self):
+        yield from self[: self.base]
+        yield from self._ring
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                return self[start:stop][::step]
+            if stop <= start:
+                return []
+            out = []
+            if start < self.base:
+                out = self.store.load_range(self.ip, start, min(stop, self.base) - start)
+            lo, hi = max(start, self.base) - self.base, stop - self.base
+            if hi > lo:
+                out.extend(itertools.islice(self._ring, lo, hi))
+            return out
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("conversation index out of range")
+        if idx >= self.base:
+            return self._ring[idx - self.base]
+        return self[idx : idx + 1][0]
+
+    @property
+    def in_memory(self):
+        return len(self._ring)
+
+    def append(self, record):
+        """追加到末尾，会话按到达顺序排列；须在交给 HistoryStore 之前调用，数据库的 (ts, id) 顺序才与下标一致"""
+        if self._ring and record.ts < self._ring[-1].ts:
+            # 收到的消息在流水线线程生成时间戳、稍后才进入会话，可能早于期间发出的消息；
+            # 拉平到上一条而不是插到中间，已经交给 HistoryWindow 的下标保持不变
+            record.ts = self._ring[-1].ts
+        self._ring.append(record)
+        size = record.nbytes()
+        self.nbytes += size
+        return size
+
+    def evict(self, keep):
+        """只保留最近 keep 条在内存中，返回释放的字节数（估算）"""
+        freed = 0
+        while len(self._ring) > keep:
+            freed += self._ring.popleft().nbytes()
+            self.base += 1
+        self.nbytes -= freed
+        return freed
+
+
+def _bigrams(msg):
+    text = msg.lower()
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+class HistoryStore:
+    """按 (联系人 IP, 时间戳) 索引的聊天记录库"""
+
+    def __init__(self, path, batch_size=500, scan_limit=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.scan_limit = scan_limit  # 没有索引可用的查询只扫描最近这么多条
+        self._queue = queue.Queue()
+        self._bigrams_ready = threading.Event()  # 旧库由写线程补建二字索引，完成前 2 字查询按 scan_limit 扫描
+
+        # 读连接：WAL 模式下读写互不阻塞
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.execute("PRAGMA journal_mode=WAL")
+        self._reader.executescript(_SCHEMA)
+        columns = {row[1] for row in self._reader.execute("PRAGMA table_info(messages)")}
+        if "status" not in columns:  # 旧版数据库升级
+            self._reader.execute("ALTER TABLE messages ADD COLUMN status TEXT")
+            self._reader.commit()
+        self.fts = self._init_fts()
+        # 主键在入队时就分配，状态更新等后续写入可以按 id 定位，不必等记录落盘
+        last_id = self._reader.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+        self._ids = itertools.count((last_id or 0) + 1)
+
+        self._writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer_thread.start()
+
+    def _init_fts(self):
+        """建立全文索引（旧库首次升级时补建），SQLite 不支持 FTS5 时返回 False，搜索退化为 LIKE 扫描"""
+        if self._reader.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+            return True
+        try:
+            self._reader.executescript("BEGIN;" + _FTS_SCHEMA + "COMMIT;")
+        except sqlite3.OperationalError as e:
+            print(f"Full-text index unavailable, falling back to LIKE search: {e}")
+            self._reader.rollback()
+            return False
+        return True
+
+    # ================= 写入 =================
+    def append(self, ip, record):
+        """非阻塞：为记录分配 id 后进入写队列，由后台线程批量落盘"""
+        record.id = next(self._ids)
+        self._queue.put(("insert", (record.id, ip, record.ts, record.type, record.msg, record.time, record.status)))
+
+    def update_status(self, record_id, status):
+        """更新某条记录的投递状态（pending / delivered / failed）"""
+        self._queue.put(("status", (status, record_id)))
+
+    def _init_bigrams(self, conn):
+        """写线程启动时调用：建表与补建旧记录在同一个事务里，中途退出不会留下不完整的索引"""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_bigram'").fetchone():
+            try:
+                with conn:
+                    conn.executescript("BEGIN;" + _BIGRAM_SCHEMA)
+                    rows = conn.execute("SELECT id, msg FROM messages")
+                    conn.executemany(
+                        "INSERT INTO messages_bigram (gram, id) VALUES (?, ?)",
+                        ((gram, rowid) for rowid, msg in rows for gram in _bigrams(msg)),
+                    )
+            except sqlite3.Error as e:
+                print(f"Bigram index unavailable: {e}")
+                return
+        self._bigrams_ready.set()
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_bigrams(conn)
+        running = True
+        while running:
+            items = [self._queue.get()]
+            # 把已经排队的记录一起取走，一个事务提交
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            taken = len(items)
+            if _STOP in items:
+                running = False
+                items = [i for i in items if i is not _STOP]
+            if items:
+                try:
+                    with conn:
+                        # 按入队顺序执行，保证状态更新落在对应的插入之后
+                        for kind, row in items:
+                            if kind == "insert":
+                                conn.execute("INSERT INTO messages (id, ip, ts, type, msg, time, status) VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                                if self._bigrams_ready.is_set():
+                                    conn.executemany(
+                                        "INSERT INTO messages_bigram (gram, id) VALUES (?, ?)", ((gram, row[0]) for gram in _bigrams(row[4]))
+                                    )
+                            else:
+                                conn.execute("UPDATE messages SET status = ? WHERE id = ?", row)
+                except Exception as e:  # 不能让写线程退出：之后的 flush 会永远等不到 task_done
+                    print(f"History Write Error: {e}")
+            for _ in range(taken):
+                self._queue.task_done()
+        conn.close()
+
+    def flush(self, timeout=None):
+        """阻塞直到写队列中的记录全部落盘；给定 timeout 时最多等待这么久，返回是否已全部落盘"""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    # ================= 读取 =================
+    # 排序统一用 (ts, id)：同一时间戳的记录按写入顺序，与内存中的顺序一致
+    def load_recent(self, ip, limit):
+        """读取某联系人最近 limit 条记录（按时间正序）"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT id, ts, type, msg, time, status FROM messages WHERE ip = ? ORDER BY ts DESC, id DESC LIMIT ?",
+                (ip, limit),
+            ).fetchall()
+        rows.reverse()
+        return [Record(t, m, tm, ts, st, i) for i, ts, t, m, tm, st in rows]
+
+    def load_range(self, ip, offset, limit):
+        """按绝对位置读取某联系人的记录：第 offset 条起的 limit 条（按时间正序）"""
+        # 被淘汰的记录可能还在写队列里；在界面线程调用，等待有上限，写线程卡住时不至于卡死界面
+        if not self.flush(_READ_FLUSH_TIMEOUT):
+            print("History flush timed out, reading committed rows only")
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT id, ts, type, msg, time, status FROM messages WHERE ip = ? ORDER BY ts, id LIMIT ? OFFSET ?",
+                (ip, limit, offset),
+            ).fetchall()
+        return [Record(t, m, tm, ts, st, i) for i, ts, t, m, tm, st in rows]
+
+    def count(self, ip):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM messages WHERE ip = ?", (ip,)).fetchone()[0]
+
+    def search(self, query, limit=50):
+        """
+        在所有联系人的聊天记录中搜索子串，最新的在前，返回 [(ip, id, Record), ...]
+        3 个字及以上走全文索引，2 个字走二字索引；
+        其余情况（单字查询、SQLite 不支持 FTS5、旧库的二字索引还在补建）没有索引可用，只在最近 scan_limit 条记录中 LIKE 扫描
+        """
+        query = query.strip()
+        if not query:
+            return []
+        self.flush(_READ_FLUSH_TIMEOUT)  # 超时只会漏掉还没落盘的最新几条
+        if self.fts and len(query) >= 3:
+            sql = (
+                "SELECT m.id, m.ip, m.ts, m.type, m.msg, m.time, m.status FROM messages_fts f "
+                "JOIN messages m ON m.id = f.rowid WHERE messages_fts MATCH ? ORDER BY f.rowid DESC LIMIT ?"
+            )
+            params = ('"' + query.replace('"', '""') + '"', limit)
+        elif len(query) == 2 and self._bigrams_ready.is_set():
+            sql = (
+                "SELECT m.id, m.ip, m.ts, m.type, m.msg, m.time, m.status FROM messages_bigram b "
+                "JOIN messages m ON m.id = b.id WHERE b.gram = ? ORDER BY b.id DESC LIMIT ?"
+            )
+            params = (query.lower(), limit)
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            sql = (
+                "SELECT id, ip, ts, type, msg, time, status FROM messages "
+                "WHERE id > (SELECT IFNULL(MAX(id), 0) FROM messages) - ? AND msg LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?"
+            )
+            params = (self.scan_limit, pattern, limit)
+        with self._read_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+        return [(ip, rowid, Record(t, m, tm, ts, st, rowid)) for rowid, ip, ts, t, m, tm, st in rows]
+
+    def position(self, ip, ts, rowid):
+        """某条记录在该联系人记录中的绝对位置（与 Conversation 下标一致）"""
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT COUNT(*) FROM messages WHERE ip = ? AND (ts < ? OR (ts = ? AND id < ?))",
+                (ip, ts, ts, rowid),
+            ).fetchone()[0]
+
+    def load_all_recent(self, limit):
+        """启动时调用：每个联系人各取最近 limit 条，返回 {ip: Conversation}"""
+        with self._read_lock:
+            ips = [r[0] for r in self._reader.execute("SELECT DISTINCT ip FROM messages")]
+        return {ip: Conversation(self, ip, self.load_recent(ip, limit), self.count(ip)) for ip in ips}
+
+    def close(self):
+        """退出时调用：等待写队列清空后关闭"""
+        self._queue.put(_STOP)
+        self._writer_thread.join(timeout=5)
+        with self._read_lock:
+            self._reader.close()
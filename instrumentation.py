@@ -0,0 +1,147 @@
+# instrumentation.py
+# (基建层)：热路径计时与计数
+# 由 settings.INSTRUMENTATION 开启；关闭时 timed 直接返回原函数，count / mark 只做一次布尔判断
+import bisect
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from settings import INSTRUMENTATION
+
+# 直方图桶上界（毫秒），百分位取所在桶的上界，足够看出量级变化
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # 最后一个桶收纳超过上限的值
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+            self.total += 1
+            self.sum += ms
+            if ms > self.max:
+                self.max = ms
+
+    def percentile(self, p):
+        if not self.total:
+            return 0.0
+        rank = self.total * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Meter:
+    """按秒分桶的计数器，rate() 返回最近 window 秒的平均速率"""
+
+    def __init__(self, window=5):
+        self.window = window
+        self.total = 0
+        self._seconds = deque(maxlen=window + 1)  # [[秒, 次数], ...]
+
+    def mark(self, n=1):
+        self.total += n
+        now = int(time.monotonic())
+        if self._seconds and self._seconds[-1][0] == now:
+            self._seconds[-1][1] += n
+        else:
+            self._seconds.append([now, n])
+
+    def rate(self):
+        now = int(time.monotonic())
+        # 只统计已经结束的整秒
+        return sum(n for sec, n in self._seconds if now - self.window <= sec < now) / self.window
+
+
+class Stats:
+    def __init__(self, enabled=INSTRUMENTATION):
+        self.enabled = enabled
+        self.histograms = {}
+        self.meters = {}
+        self.gauges = {}  # name -> 无参函数，读取时才求值（例如网络层的丢包计数）
+
+    def histogram(self, name):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms.setdefault(name, Histogram())
+        return h
+
+    def observe(self, name, ms):
+        if self.enabled:
+            self.histogram(name).observe(ms)
+
+    def mark(self, name, n=1):
+        if not self.enabled:
+            return
+        m = self.meters.get(name)
+        if m is None:
+            m = self.meters.setdefault(name, Meter())
+        m.mark(n)
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def timed(self, name):
+        """装饰器：记录函数耗时；未开启统计时原样返回，不增加调用开销"""
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+            hist = self.histogram(name)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    hist.observe((time.perf_counter() - start) * 1000)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        return {
+            "timers": {name: h.summary() for name, h in sorted(self.histograms.items())},
+            "rates": {name: {"total": m.total, "per_sec": m.rate()} for name, m in sorted(self.meters.items())},
+            "gauges": {name: fn() for name, fn in sorted(self.gauges.items())},
+        }
+
+    def report_lines(self):
+        """CMD 模式 stats 命令的文本输出"""
+        if not self.enabled:
+            return ["Instrumentation is off. Set INSTRUMENTATION = True in settings.py and restart."]
+        snap = self.snapshot()
+        lines = [f"{'timer':<28}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, s in snap["timers"].items():
+            lines.append(f"{name:<28}{s['count']:>8}{s['p50']:>10.2f}{s['p99']:>10.2f}{s['max']:>10.2f}")
+        lines.append("")
+        for name, r in snap["rates"].items():
+            lines.append(f"{name:<28}{r['total']:>8} total {r['per_sec']:>10.1f}/s")
+        for name, value in snap["gauges"].items():
+            lines.append(f"{name:<28}{value:>8}")
+        return lines
+
+
+# 进程内共享一个实例
+stats = Stats()
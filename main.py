@@ -1,54 +1,135 @@
 # main.py
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import tkinter as tk
-from tkinter import simpledialog, messagebox
 import sys
 import os
-import code
-import subprocess
-from datetime import datetime
+import queue
+from collections import deque
+
+from settings import PORT, THEMES, ICONS, RECV_BATCH_MAX, FRAME_INTERVAL_MS, BACKGROUND_FRAME_MS, STATS_PROBE_MS
+from settings import CMD_WHITELIST, CMD_TIMEOUT, CMD_ENCODING, CMD_MAX_LINES
+from core import ChatCore
+from contacts import SidebarModel
+from platform_support import get_platform
+from instrumentation import stats
+
+# 视图 (views)、命令执行器 (executor)、Python 解释器 (console)、对话框等在第一次用到时才导入，缩短冷启动时间
+_IMPORT_END = time.perf_counter()
+
+
+class StartupProfiler:
+    """--profile-startup：记录启动各阶段耗时并打印"""
 
-from settings import CONTACTS, PORT, THEMES, ICONS
-from network import CommManager
-from components import StdoutRedirector
-from views import CmdView, NormalView, WpsView
-import ctypes
-from ctypes import windll
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = [("import modules", _IMPORT_END - _IMPORT_START)]
+        self._last = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        if self.enabled:
+            self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = sum(t for _, t in self.phases)
+        print("=== startup profile ===")
+        for name, t in self.phases:
+            print(f"{name:<24}{t * 1000:9.1f} ms")
+        print(f"{'total':<24}{total * 1000:9.1f} ms")
 
 
 class UltimateChat:
-    def __init__(self, root,start_mode="cmd"):
+    def __init__(self, root,start_mode="cmd", profiler=None):
         self.root = root
+        self.profiler = profiler or StartupProfiler()
+        self.platform = get_platform()
         self.current_mode = None
         self.current_view = None
+        self.views = {}  # 视图缓存: {mode: view}，深浅色切换时原地换色
         self.is_dark_mode = True  # 默认为深色模式
         self.current_path = os.getcwd()
 
-        self.displayed_contacts = CONTACTS[:]
+        # 后台线程 -> Tk 主线程的回调队列，由 _pump 每帧统一执行
+        self._ui_queue = queue.SimpleQueue()
+
+        # === 核心：网络 / 聊天记录 / 联系人都由 ChatCore 管理，界面只订阅事件 ===
+        self.core = ChatCore()
+        self.core.subscribe("messages", self._distribute_msg)
+        self.core.subscribe("status", self._on_delivery_status)
+        self.core.subscribe("messages", self._on_activity)
+        self.core.subscribe("unread", self._on_unread)
+        self.core.subscribe("contact", self._on_contact_changed)
+        self.contacts = self.core.contacts
+        self.chat_history = self.core.chat_history
+        self.profiler.mark("load history")
+
+        # 侧栏按最近活动排序，初始顺序取各会话最后一条记录的时间
+        activity = {}
+        for c in self.contacts:
+            conv = self.chat_history.get(c["ip"])
+            if conv:
+                activity[c["id"]] = conv[-1]["ts"]
+        self.sidebar = SidebarModel(self.contacts, activity)
+        self.sidebar.listener = self._on_sidebar_row
+        self.displayed_contacts = self.sidebar.rows  # 与侧栏 Listbox 行一一对应
         self.target_addr = None  # 初始不连接任何人
         self.target_name = None  # 初始无选中联系人
         self.target_ip = None  # 新增：用于索引聊天记录
 
-        # === 核心：聊天记录存储 ===
-        # 结构: { '192.168.1.20': [ {'type': 'self'/'peer', 'msg': '...', 'time': '...'}, ... ] }
-        self.chat_history = {}
+        # 后台模式：窗口最小化期间消息只入库、计未读，不碰 Text / Listbox，恢复时一次性补齐
+        self.in_background = False
+        self._background_lines = deque(maxlen=CMD_MAX_LINES)  # CMD 模式下后台期间的回显
+        self._remapping = False  # set_app_window 自己隐藏 / 重新显示窗口期间为 True
 
-        # Python 解释器状态
+        # Python 解释器状态（解释器运行在独立子进程中，首次进入 python 模式时启动）
         self.in_python_mode = False
-        self.python_locals = {}
-        self.console = code.InteractiveConsole(self.python_locals)
-        self.redirector = StdoutRedirector(self._log_to_cmd_view)
 
         # 启动网络
-        self.network = CommManager(PORT, self.on_message_received)
-        err = self.network.start()
+        err = self.core.start()
         if err is not True:
+            from tkinter import messagebox
+
             messagebox.showerror("Network Error", f"Port {PORT} failed: {err}")
             sys.exit(1)
+        self.profiler.mark("start network")
+
+        # 命令执行器与 Python 解释器第一次用到时再创建
+        self._command_runner = None
+        self._console = None
+        self.root.after(FRAME_INTERVAL_MS, self._pump)
+        if stats.enabled:
+            self._probe_due = time.perf_counter() + STATS_PROBE_MS / 1000
+            self.root.after(STATS_PROBE_MS, self._lag_probe)
 
         self.setup_window()
         self.switch_mode(start_mode)# 默认启动到 CMD 模式，方便调试
+        self.profiler.mark("build first view")
         self.set_app_window()
 
+    @property
+    def command_runner(self):
+        if self._command_runner is None:
+            from executor import CommandRunner
+
+            self._command_runner = CommandRunner(
+                self.post_to_ui, self._on_command_output, self._on_command_done, timeout=CMD_TIMEOUT, encoding=CMD_ENCODING
+            )
+        return self._command_runner
+
+    @property
+    def console(self):
+        if self._console is None:
+            from console import PythonConsole
+
+            self._console = PythonConsole(self.post_to_ui, self._on_console_output, self._on_console_result, self._on_console_exit)
+        return self._console
+
     # 窗口居中方法
     def center_window(self, width=900, height=600):
         screen_width = self.root.winfo_screenwidth()
@@ -58,20 +139,10 @@ class UltimateChat:
         self.root.geometry(f"{width}x{height}+{int(x)}+{int(y)}")
 
     def set_app_window(self):
-        GWL_EXSTYLE = -20
-        WS_EX_APPWINDOW = 0x00040000
-        WS_EX_TOOLWINDOW = 0x00000080
-
-        try:
-            hwnd = windll.user32.GetParent(self.root.winfo_id())
-            style = windll.user32.GetWindowLongW(hwnd, GWL_EXSTYLE)
-            style = style & ~WS_EX_TOOLWINDOW
-            style = style | WS_EX_APPWINDOW
-            windll.user32.SetWindowLongW(hwnd, GWL_EXSTYLE, style)
-            self.root.wm_withdraw()
-            self.root.after(10, lambda: self.root.wm_deiconify())
-        except Exception as e:
-            print(f"Force Taskbar Icon Failed: {e}")
+        # 无边框窗口强制显示任务栏图标（仅 Windows 生效）
+        # Windows 上会 withdraw 再 deiconify 一次，期间的 Unmap / Map 不是用户最小化
+        if self.platform.force_taskbar_icon(self.root):
+            self._remapping = True
 
     def setup_window(self):
         self.center_window(900, 600)
@@ -79,49 +150,74 @@ class UltimateChat:
         self.root.bind("<F11>", lambda e: self.switch_mode("wps"))
         self.root.bind("<F12>", lambda e: self.switch_mode("normal"))
         self.root.bind("<Escape>", lambda e: self.root.iconify())
+        self.root.bind("<F9>", lambda e: self.toggle_stats_overlay())
+        self.root.bind("<Unmap>", self._on_unmap)
+        self.root.bind("<Map>", self._on_map)
 
     def switch_mode(self, mode):
         self.current_mode = mode
         if self.current_view:
-            self.current_view.destroy()
+            # 视图缓存：只隐藏不销毁，再次切回时直接复用
+            self.current_view.pack_forget()
 
         self._update_app_icon(mode)
 
+        # 每种模式只缓存一个视图；深浅色不同时原地换色（CMD 视图只有一套配色），WPS 文档因此不会分裂成两份
+        scheme_key = "dark" if self.is_dark_mode else "light"
+        view = self.views.get(mode)
+        if view is not None and hasattr(view, "apply_scheme") and view.is_dark != self.is_dark_mode:
+            view.apply_scheme(self.is_dark_mode)
+
+        view_cls = self._view_class(mode) if view is None else None
+
         if mode == "cmd":
             self.root.overrideredirect(False)
             self.root.title(THEMES["cmd"]["title"])
             self.root.configure(bg=THEMES["cmd"]["bg_root"])
-            self.current_view = CmdView(self.root, self)
-            # self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
-            if self.in_python_mode:
-                self._log_to_cmd_view(">>> ", no_newline=True)
-            else:
-                self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
+            if view is None:
+                view = view_cls(self.root, self)
+                if self.in_python_mode:
+                    view.log(">>> ", no_newline=True)
+                else:
+                    view.log(f"{self.current_path}>", no_newline=True)
 
         elif mode == "normal":
             self.root.overrideredirect(False)
             self.root.title(THEMES["normal"]["title"])
             self.root.configure(bg=THEMES["normal"]["bg_root"])
-            # 传递 is_dark_mode 给 NormalView
-            self.current_view = NormalView(self.root, self, self.is_dark_mode)
+            if view is None:
+                # 传递 is_dark_mode 给 NormalView
+                view = view_cls(self.root, self, self.is_dark_mode)
 
         elif mode == "wps":
             self.root.overrideredirect(True)
 
             # [关键修复] 获取正确的 WPS 主题配置
-            scheme_key = "dark" if self.is_dark_mode else "light"
             wps_bg = THEMES["wps"][scheme_key]["bg_root"]
 
             self.root.configure(bg=wps_bg)
 
-            # 传递 is_dark_mode 给 WpsView
-            self.current_view = WpsView(self.root, self, self.is_dark_mode)
+            if view is None:
+                # 传递 is_dark_mode 给 WpsView
+                view = view_cls(self.root, self, self.is_dark_mode)
             self.root.after(10, self.set_app_window)
 
+        if mode in self.views:
+            # 复用的视图：重新套用标题栏等窗口级主题
+            view.on_show()
+        self.views[mode] = view
+        self.current_view = view
         self.current_view.pack(fill="both", expand=True)
-        # 切换模式后，立即加载当前选中联系人的历史记录
+        # 切换模式后加载当前联系人的历史记录（已渲染过的视图只补增量）
         self.load_history_to_view()
 
+    @staticmethod
+    def _view_class(mode):
+        # 视图模块在第一次切换时才导入
+        import views
+
+        return {"cmd": views.CmdView, "normal": views.NormalView, "wps": views.WpsView}[mode]
+
     def _update_app_icon(self, mode):
         icon_path = ICONS.get(mode)
         if icon_path and os.path.exists(icon_path):
@@ -143,6 +239,7 @@ class UltimateChat:
         self.target_addr = (contact["ip"], contact["port"])
         self.target_name = contact["name"]
         self.target_ip = contact["ip"]
+        self.core.set_active(self.target_ip)
         # 切换联系人时，加载该人的历史记录
         self.load_history_to_view()
 
@@ -155,24 +252,20 @@ class UltimateChat:
             return
 
         # 获取记录
-        records = self.chat_history.get(self.target_ip, [])
+        records = self.core.history_for(self.target_ip)
 
         # 通知视图层渲染
         if hasattr(self.current_view, "render_history"):
             self.current_view.render_history(records, self.target_name)
 
     def add_new_contact(self):
+        from tkinter import simpledialog
+
         name = simpledialog.askstring("Add", "Name:")
         ip = simpledialog.askstring("Add", "IP:")
         if name and ip:
-            self.displayed_contacts.append(
-                {
-                    "id": str(len(self.displayed_contacts)),
-                    "name": name,
-                    "ip": ip,
-                    "port": 9999,
-                }
-            )
+            # 目录会通知 _on_contact_changed 增量更新列表
+            self.contacts.add({"id": self.contacts.new_id(), "name": name, "ip": ip, "port": 9999})
 
     def modify_contact(self):
         if not hasattr(self.current_view, "contact_list"):
@@ -181,13 +274,13 @@ class UltimateChat:
             idx = self.current_view.contact_list.curselection()[0]
             contact = self.displayed_contacts[idx]
 
+            from tkinter import simpledialog
+
             new_name = simpledialog.askstring("修改备注", "输入新名称:", initialvalue=contact["name"])
             if new_name:
-                contact["name"] = new_name
-                for c in CONTACTS:
-                    if c["id"] == contact["id"]:
-                        c["name"] = new_name
-                self.current_view.refresh_contacts()
+                self.contacts.update(contact["id"], name=new_name)
+                if self.target_addr == (contact["ip"], contact["port"]):
+                    self.target_name = new_name
         except IndexError:
             pass
 
@@ -197,84 +290,206 @@ class UltimateChat:
         try:
             idx = self.current_view.contact_list.curselection()[0]
             contact = self.displayed_contacts[idx]
+            from tkinter import messagebox
+
             if messagebox.askyesno("确认", f"确定删除 {contact['name']} 吗?"):
-                if self.target_name == contact["name"]:
+                if self.target_addr == (contact["ip"], contact["port"]):
                     self.target_name = None
                     self.target_ip = None
                     self.target_addr = None
+                    self.core.set_active(None)
                     if hasattr(self.current_view, "reset_chat_area"):
                         self.current_view.reset_chat_area()
                     self.load_history_to_view()
 
-                self.displayed_contacts.pop(idx)
-                for i, c in enumerate(CONTACTS):
-                    if c["id"] == contact["id"]:
-                        CONTACTS.pop(i)
-                        break
-                self.current_view.refresh_contacts()
+                self.contacts.remove(contact["id"])
         except IndexError:
             pass
 
     def filter_contacts(self, query):
-        query = query.lower().strip()
-        if not query:
-            self.displayed_contacts = CONTACTS[:]
+        self.sidebar.filter(query)
+
+    def _on_contact_changed(self, event, contact):
+        # ContactDirectory 变更回调：由侧栏模型修补受影响的一行
+        self.sidebar.on_contact_changed(event, contact)
+
+    def _on_activity(self, batch):
+        # 每个会话只取本批最后一条的时间，一批消息每个联系人最多移动一行
+        latest = {ip: rec["ts"] for ip, _, rec in batch}
+        for ip, ts in latest.items():
+            contact = self.contacts.by_ip(ip)
+            if contact:
+                self.sidebar.touch(contact, ts)
+
+    def _on_unread(self, changes):
+        for ip, count in changes.items():
+            contact = self.contacts.by_ip(ip)
+            if contact:
+                self.sidebar.set_unread(contact, count)
+
+    def _on_sidebar_row(self, op, idx, contact, unread):
+        # 侧栏模型的行级变更，只转发给当前显示联系人列表的视图；其他视图在 on_show 时整表刷新
+        view = self.current_view
+        if self.in_background or not hasattr(view, "insert_contact_row"):
+            return
+        if op == "insert":
+            view.insert_contact_row(idx, contact, unread)
+        elif op == "update":
+            view.update_contact_row(idx, contact, unread)
+        elif op == "move":
+            view.move_contact_row(idx[0], idx[1], contact, unread)
         else:
-            self.displayed_contacts = [c for c in CONTACTS if query in c["name"].lower() or query in c["ip"]]
-
-        if hasattr(self.current_view, "refresh_contacts"):
-            self.current_view.refresh_contacts()
-
-    def on_message_received(self, msg, ip):
-        self.root.after(0, lambda: self._distribute_msg(msg, ip))
-
-    def _process_received_msg(self, msg, ip):
-        # 1. 存入历史记录
-        if ip not in self.chat_history:
-            self.chat_history[ip] = []
+            view.remove_contact_row(idx)
+
+    # ================= 聊天记录搜索 =================
+    def search_history(self, query):
+        """返回 [(显示文本, 结果), ...]，供 SearchPopup 与 CMD 的 find 命令使用"""
+        results = []
+        for ip, rowid, rec in self.core.search_history(query):
+            when = time.strftime("%m-%d %H:%M", time.localtime(rec["ts"]))
+            name = "我" if rec["type"] == "self" else self.contacts.name_for(ip, ip)
+            text = rec["msg"].replace("\n", " ")
+            results.append((f"[{when}] {name}: {text[:80]}", (ip, rowid, rec)))
+        return results
+
+    def open_search_hit(self, hit):
+        # 切换到结果所属的联系人，并让视图定位到该条记录
+        ip, rowid, rec = hit
+        contact = self.contacts.by_ip(ip)
+        self.target_ip = ip
+        self.target_name = contact["name"] if contact else ip
+        self.target_addr = (ip, contact["port"] if contact else PORT)
+        self.core.set_active(ip)
+        if hasattr(self.current_view, "show_search_hit"):
+            index = self.core.locate(ip, rowid, rec)
+            self.current_view.show_search_hit(self.core.history_for(ip), self.target_name, index)
+        else:
+            self.load_history_to_view()
 
-        time_str = datetime.now().strftime("%H:%M")
-        record = {"type": "peer", "msg": msg, "time": time_str}
-        self.chat_history[ip].append(record)
+    def post_to_ui(self, fn, *args):
+        """线程安全：把回调投递到 Tk 主线程执行"""
+        self._ui_queue.put((fn, args))
 
-        # 2. 如果当前正在看这个人（或者是CMD模式），更新UI
-        if self.current_mode == "cmd" or self.target_ip == ip:
-            if hasattr(self.current_view, "append_msg"):
-                # 查找发送者名字
-                sender_name = next((c["name"] for c in CONTACTS if c["ip"] == ip), ip)
-                self.current_view.append_msg(record, sender_name)
+    def _pump(self):
+        # 主线程帧循环：执行后台线程投递的回调，再让 ChatCore 把接收队列里的消息一次性取走
+        # 单个回调出错只记录下来，不能打断本帧剩下的回调，更不能让帧循环停掉
+        if not self.core.running:
+            return
+        try:
+            while True:
+                try:
+                    fn, args = self._ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"UI callback failed: {e!r}")
+            try:
+                self.core.process_pending(RECV_BATCH_MAX)
+            except Exception as e:
+                print(f"Process messages failed: {e!r}")
+        finally:
+            self.root.after(BACKGROUND_FRAME_MS if self.in_background else FRAME_INTERVAL_MS, self._pump)
+
+    # ================= 后台模式 =================
+    def _on_unmap(self, event):
+        # 子控件的 Unmap 也会冒泡到根窗口的绑定上，只处理根窗口本身（Esc 老板键 / 最小化按钮）
+        if event.widget is not self.root or self.in_background:
+            return
+        if self._remapping or self.root.state() == "withdrawn":
+            return  # 程序自己 withdraw（切换到 WPS 时刷新任务栏图标），不是最小化
+        self.in_background = True
+        self.core.set_active(None)  # 当前会话的新消息也计入未读
 
-    def _distribute_msg(self, msg, ip):
-        name = next((c["name"] for c in CONTACTS if c["ip"] == ip), ip)
-        time_str = datetime.now().strftime("%H:%M")
+    def _on_map(self, event):
+        if event.widget is not self.root:
+            return
+        self._remapping = False
+        if not self.in_background:
+            return
+        # 先清掉当前会话的未读（此时仍在后台，不触发行更新），再整体刷新一次
+        self.core.set_active(self.target_ip)
+        self.in_background = False
+        if self._background_lines:
+            lines = list(self._background_lines)
+            self._background_lines.clear()
+            self._log_replies(lines)
+        if hasattr(self.current_view, "refresh_contacts"):
+            self.current_view.refresh_contacts()
+        self.load_history_to_view()
 
+    # ================= 性能统计 =================
+    def _lag_probe(self):
+        # after 回调实际执行时间与预定时间之差 = Tk 事件队列的积压延迟
+        now = time.perf_counter()
+        stats.observe("tk.lag", max(0.0, (now - self._probe_due) * 1000))
+        if self.core.running:
+            self._probe_due = now + STATS_PROBE_MS / 1000
+            self.root.after(STATS_PROBE_MS, self._lag_probe)
+
+    def toggle_stats_overlay(self):
+        if hasattr(self.current_view, "toggle_stats_overlay"):
+            self.current_view.toggle_stats_overlay()
+
+    def stats_overlay_lines(self):
+        if not stats.enabled:
+            return ["统计未开启", "settings.INSTRUMENTATION = True"]
+        snap = stats.snapshot()
+        rates, timers, gauges = snap["rates"], snap["timers"], snap["gauges"]
+        lines = [
+            f"recv {rates.get('recv.messages', {}).get('per_sec', 0):8.1f} msg/s",
+            f"send {rates.get('send.messages', {}).get('per_sec', 0):8.1f} msg/s",
+        ]
+        for name in ("ui.distribute_msg", "normal.append_msg", "normal.render_history", "net.send", "tk.lag"):
+            if name in timers:
+                t = timers[name]
+                lines.append(f"{name:<22} p50 {t['p50']:7.2f}  p99 {t['p99']:7.2f} ms")
+        lines.append(f"history {gauges.get('history.bytes', 0) / 1024:.1f} KiB | dropped {gauges.get('net.dropped', 0)}")
+        return lines
+
+    @stats.timed("ui.distribute_msg")
+    def _distribute_msg(self, batch):
+        # ChatCore "messages" 事件（流水线的 notify 段）: [(ip, 发送者名称, record), ...]，已入库；
+        # 只有当前会话的记录进入聊天区（经 append_msg 走 HistoryWindow 的索引），其他会话只体现在侧栏未读数上
         if self.current_mode == "cmd":
-            self.current_view.log(f"Reply from {ip}: {msg}", "cmd_text")
-            if self.in_python_mode:
-                self._log_to_cmd_view(">>> ", no_newline=True)
+            lines = [f"Reply from {ip}: {rec['msg']}" for ip, _, rec in batch]
+            if self.in_background:
+                self._background_lines.extend(lines)
             else:
-                self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
+                self._log_replies(lines)
+            return
 
-        elif self.current_mode == "normal":
-            self.current_view.log(f"[{name}] [{time_str}]\n{msg}\n", "normal_peer")
-        elif self.current_mode == "wps":
-            self.current_view.log(f"[{name}] [{time_str}]: {msg}\n", "ai_peer")
+        # 后台或聊天区隐藏时不渲染，恢复 / 选中联系人时由 load_history_to_view 补齐
+        if self.in_background or not getattr(self.current_view, "chat_visible", lambda: True)():
+            return
+        if not hasattr(self.current_view, "append_msg"):
+            return
+
+        # 名称按 ip 取（联系人名或群名），同一 ip 的记录共用一个名称，一次 append_msg 追加
+        records = [rec for ip, _, rec in batch if ip == self.target_ip]
+        if records:
+            name = next(name for ip, name, _ in batch if ip == self.target_ip)
+            self.current_view.append_msg(records, name)
+
+    def _log_replies(self, lines):
+        self.current_view.log("\n".join(lines), "cmd_text")
+        if self.in_python_mode:
+            self._log_to_cmd_view(">>> ", no_newline=True)
+        else:
+            self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
 
     def handle_chat_send(self, msg, tag_self):
         if not msg or not self.target_addr:
             return
-        self.network.send(msg, self.target_addr)  # 先发后存，确保网络异常时不丢记录
-        # 存入历史记录
-        target_ip = self.target_addr[0]
-        if target_ip not in self.chat_history:
-            self.chat_history[target_ip] = []
-        time_str = datetime.now().strftime("%H:%M")
-        record = {"type": "self", "msg": msg, "time": time_str}
-        self.chat_history[target_ip].append(record)
+        record = self.core.send(self.target_addr, msg)
+        contact = self.contacts.by_addr(*self.target_addr)
+        if contact:
+            self.sidebar.touch(contact, record["ts"])
 
         # 更新 UI
         if hasattr(self.current_view, "append_msg"):
-            self.current_view.append_msg(record, "我")
+            self.current_view.append_msg([record], "我")
         """
         if self.current_mode == "normal":
             self.current_view.log(f"{msg} :[{time_str}]\n", tag_self)
@@ -282,27 +497,40 @@ class UltimateChat:
             self.current_view.log(f"{msg}\n", tag_self)
         """
 
+    def _on_delivery_status(self, ip, record, status):
+        # ChatCore "status" 事件：记录状态已更新并落盘，这里只处理界面提示
+        if status == "failed" and ip == self.target_ip and not self.in_background and hasattr(self.current_view, "log"):
+            preview = record["msg"][:20]
+            if self.current_mode == "cmd":
+                self.current_view.log(f"Request timed out: {preview}", "cmd_err")
+            else:
+                self.current_view.log(f"[{record['time']}] 消息未送达: {preview}", "time_tag")
+
     def handle_cmd_input(self, msg):
         if not self.in_python_mode and msg.lower() == "python":
             self.in_python_mode = True
-            self._log_to_cmd_view(f"Python {sys.version.split()[0]} on win32\n")
+            try:
+                self.console.start()
+            except OSError as e:
+                self.in_python_mode = False
+                self._log_to_cmd_view(str(e) + "\n", "cmd_err")
+                self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
+                return
+            self._log_to_cmd_view(f"Python {sys.version.split()[0]} on {sys.platform}\n")
             self._log_to_cmd_view(">>> ", no_newline=True)
             return
 
         if self.in_python_mode:
             if msg.lower() in ["exit()", "quit()"]:
                 self.in_python_mode = False
+                self.console.close()
                 self._log_to_cmd_view(f"\n{self.current_path}>", no_newline=True)
                 return
-            old_out = sys.stdout
-            try:
-                sys.stdout = self.redirector
-                is_incomplete = self.console.push(msg)
-                self._log_to_cmd_view("... " if is_incomplete else ">>> ", no_newline=True)
-            except Exception as e:
-                self._log_to_cmd_view(str(e) + "\n>>> ", "cmd_err", no_newline=True)
-            finally:
-                sys.stdout = old_out
+            if self.console.busy:
+                self._log_to_cmd_view("代码正在执行，按 Ctrl+C 中断。\n", "cmd_err")
+                return
+            # 结果由 _on_console_result 异步回传
+            self.console.push(msg)
             return
 
         if msg.lower().startswith("cd "):
@@ -313,40 +541,96 @@ class UltimateChat:
                 self._log_to_cmd_view("Path not found.\n", "cmd_err")
         elif msg.lower() in ["cls", "clear"]:
             self.current_view.clear()
+        elif msg.lower().startswith("find "):
+            start = time.perf_counter()
+            results = self.search_history(msg[5:])
+            elapsed = (time.perf_counter() - start) * 1000
+            lines = [label for label, _ in results] + [f"{len(results)} match(es) in {elapsed:.1f} ms"]
+            self._log_to_cmd_view("\n".join(lines) + "\n", "cmd_text")
+        elif msg.lower() == "stats":
+            self._log_to_cmd_view("\n".join(stats.report_lines()) + "\n", "cmd_stats")
+        elif msg.split() and msg.split()[0].lower() in CMD_WHITELIST:
+            # 在后台执行，输出逐行回传，结束后由 _on_command_done 打印提示符；同一时间只跑一条命令
+            if self.command_runner.running:
+                self._log_to_cmd_view("命令正在执行，按 Ctrl+C 取消。\n", "cmd_err")
+            else:
+                # 启动失败时 run() 也已投递 on_done，提示符同样由 _on_command_done 打印
+                self.command_runner.run(msg)
+                return
         else:
-            whitelist = ["dir", "ipconfig", "ping", "ver", "whoami", "echo"]
-            if msg.split()[0].lower() in whitelist:
-                try:
-                    res = subprocess.run(msg, shell=True, capture_output=True, text=True, encoding="gbk")
-                    if res.stdout:
-                        self._log_to_cmd_view(res.stdout)
-                    if res.stderr:
-                        self._log_to_cmd_view(res.stderr, "cmd_err")
-                except Exception as e:
-                    self._log_to_cmd_view(str(e) + "\n", "cmd_err")
+            # 非命令的输入是聊天消息，命令执行期间也照常发送
+            if self.target_addr:
+                self.core.send_raw(msg, self.target_addr)
             else:
-                self.network.send(msg, self.target_addr)
+                self._log_to_cmd_view("未选择联系人，消息未发送。\n", "cmd_err")
+
+        self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
 
+    def _on_command_output(self, line, is_err):
+        self._log_to_cmd_view(line, "cmd_err" if is_err else "cmd_text", no_newline=True)
+
+    def _on_command_done(self, returncode, reason):
+        if reason == "timeout":
+            self._log_to_cmd_view(f"命令执行超过 {CMD_TIMEOUT} 秒，已终止。\n", "cmd_err")
+        elif reason == "cancelled":
+            self._log_to_cmd_view("^C\n", "cmd_err")
+        elif reason:
+            self._log_to_cmd_view(reason + "\n", "cmd_err")
         self._log_to_cmd_view(f"{self.current_path}>", no_newline=True)
 
+    def cancel_command(self):
+        """Ctrl+C：中断 python 代码或取消正在执行的命令，没有可取消的任务时返回 False"""
+        if self.in_python_mode:
+            return self.console.interrupt()
+        return self.command_runner.cancel()
+
+    # ================= Python 解释器回调 =================
+    def _on_console_output(self, text, is_err):
+        self._log_to_cmd_view(text, "cmd_err" if is_err else "cmd_text", no_newline=True)
+
+    def _on_console_result(self, more, run_stats):
+        if run_stats:
+            self._log_to_cmd_view(
+                f"[{run_stats['elapsed'] * 1000:.2f} ms | mem {run_stats['delta'] / 1024:+.1f} KiB | peak {run_stats['peak'] / 1024:.1f} KiB]\n",
+                "cmd_stats",
+                no_newline=True,
+            )
+        self._log_to_cmd_view("... " if more else ">>> ", no_newline=True)
+
+    def _on_console_exit(self):
+        if self.in_python_mode:
+            self.in_python_mode = False
+            self._log_to_cmd_view(f"\n{self.current_path}>", no_newline=True)
+
     def _log_to_cmd_view(self, text, tag="cmd_text", no_newline=False):
-        if isinstance(self.current_view, CmdView):
+        if self.current_mode == "cmd":
             self.current_view.log(text, tag, no_newline)
 
     def on_close(self):
-        self.network.close()
+        if self._command_runner:
+            self._command_runner.cancel()
+        if self._console:
+            self._console.close()
+        self.core.close()
         self.root.destroy()
 
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    try:
-        from ctypes import windll
+    import argparse
 
-        windll.shcore.SetProcessDpiAwareness(1)
-    except:
-        pass
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true", help="打印启动各阶段耗时")
+    args = parser.parse_args()
+
+    profiler = StartupProfiler(args.profile_startup)
+    get_platform().enable_dpi_awareness()
+    root = tk.Tk()
+    profiler.mark("create Tk root")
     STARTUP_MODE = "normal"
-    app = UltimateChat(root, start_mode=STARTUP_MODE)
+    app = UltimateChat(root, start_mode=STARTUP_MODE, profiler=profiler)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
+    if args.profile_startup:
+        root.update_idletasks()
+        profiler.mark("first paint")
+        profiler.report()
     root.mainloop()
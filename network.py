@@ -1,43 +1,325 @@
 # network.py
 # (模型层/网络层)：封装 UDP 通信逻辑
 # 只管发和收，不管界面怎么显示
+import itertools
+import queue
+import random
+import selectors
 import socket
 import threading
+import time
+
+import protocol
+from instrumentation import stats
+from reliable import ReliableChannel, make_acks
+
+MAX_DATAGRAM = 65535  # 单个 UDP 数据报的最大长度，接收缓冲区按此分配，不再截断
 
 
 class CommManager:
-    def __init__(self, port, on_message_received):
+    def __init__(
+        self,
+        port,
+        on_message_received,
+        batch_mode=False,
+        queue_size=10000,
+        chunk_size=1400,
+        rcvbuf=None,
+        reassembly_timeout=5.0,
+        reliable=False,
+        on_status=None,
+        reliable_options=None,
+        compress_threshold=0,
+        compress_level=6,
+        pool_size=1,
+        frame_unknown_peers=False,
+    ):
         self.port = port
         self.on_message_received = on_message_received  # 回调函数
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.running = False
 
+        # === 分帧 ===
+        # 发送时超过 chunk_size 的消息拆成多片，接收端按消息 id 重组
+        self.chunk_size = chunk_size
+        self._msg_ids = itertools.count(random.randrange(1 << 31))
+        self.reassembly_timeout = reassembly_timeout
+        self.rcvbuf = rcvbuf
+        if rcvbuf:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            except OSError as e:
+                print(f"Set SO_RCVBUF Failed: {e}")
+
+        # === 协议协商 ===
+        # 对端发来过带帧头的数据报（或经组播信标得知是新版本）后才对它使用分帧协议；
+        # 此前一律发整条 UTF-8 文本，旧版客户端照常显示。frame_unknown_peers=True 时跳过协商（全是新版本的网络）
+        self.frame_unknown_peers = frame_unknown_peers
+        self._peer_caps = {}  # addr -> 对端声明的能力位 (FLAG_CAN_COMPRESS)；在表中即表示支持分帧
+
+        # === 压缩（可选）===
+        # 每个数据报都带 FLAG_CAN_COMPRESS 声明本端能解压；只对声明过的对端压缩。
+        # 预置字典的压缩数据只有本协议的实现能解开：未声明的分帧对端收到未压缩的分帧数据，
+        # 没有协商过分帧的对端（可能是旧版客户端）走上面的纯文本路径，两者都不会收到压缩数据
+        self.compress_threshold = compress_threshold  # 不小于此字节数的消息才尝试压缩，0 为关闭
+        self.compress_level = compress_level
+        self.bytes_raw = 0  # 发送前的 UTF-8 字节数
+        self.bytes_wire = 0  # 实际发出的数据字节数（不含帧头）
+        self.decode_errors = 0  # 无法解压而丢弃的消息数
+
+        # === 可靠传输（可选）===
+        # 开启后 send 的消息带序号并等待 ACK，超时重传；结果通过 on_status(token, status) 回调
+        self.reliable_options = reliable_options or {}
+        self.reliable = ReliableChannel(on_status, **self.reliable_options) if reliable else None
+        self._pending_acks = {}  # addr -> [(msg_id, seq), ...]，收完一批数据报后合并发送
+        # 接收端去重表：本端未开启可靠模式时也要处理对方发来的可靠消息
+        self._dedup = self.reliable or ReliableChannel(**self.reliable_options)
+        # 可靠分片到达即 ACK，未收齐的消息至少要保留到发送方放弃重传为止，否则会出现“已送达”却被接收端丢弃
+        self.reassembler = protocol.Reassembler(timeout=reassembly_timeout, reliable_timeout=self._dedup.retransmit_budget)
+
+        # === 批量接收模式 ===
+        # 开启后接收线程把 socket 中排队的数据报一次性读空，放入有界队列，
+        # 由主线程按帧调用 drain() 批量取走，不再每条消息回调一次
+        self.batch_mode = batch_mode
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.dropped = 0  # 队列满时丢弃的消息数
+
+        # === 接收池（仅批量模式，需要 SO_REUSEPORT）===
+        # 同一端口再绑定 pool_size - 1 个 socket，内核按四元组哈希分流，每个 socket 一个接收线程；
+        # 同一对端的数据报总落在同一个 socket 上，各自的重组 / 去重状态互不干扰，
+        # 结果汇入同一个 inbox，单个对端的消息顺序不变。不支持 SO_REUSEPORT 的平台（Windows）退回单 socket
+        self.pool_size = pool_size if batch_mode and hasattr(socket, "SO_REUSEPORT") else 1
+        self.lanes = []  # 额外的接收 socket（CommManager 实例，只收不发）
+
+    def _bind(self):
+        if self.pool_size > 1:
+            # 带 SO_REUSEPORT 的 bind 不会因端口被另一个实例占用而失败（内核会把流量分给两边），
+            # 先用不带该选项的 socket 独占试绑一次，端口冲突时照常报错
+            if self.port:
+                probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                try:
+                    probe.bind(("0.0.0.0", self.port))
+                finally:
+                    probe.close()
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind(("0.0.0.0", self.port))
+
     def start(self):
         try:
-            self.sock.bind(("0.0.0.0", self.port))
+            self._bind()
             self.running = True
-            threading.Thread(target=self._receive_loop, daemon=True).start()
+            target = self._batch_receive_loop if self.batch_mode else self._receive_loop
+            threading.Thread(target=target, daemon=True).start()
+            if self.reliable:
+                threading.Thread(target=self._retransmit_loop, daemon=True).start()
+            self._start_pool()
             return True
         except Exception as e:
             return str(e)
 
+    def _start_pool(self):
+        port = self.sock.getsockname()[1]  # port=0 时取实际分配的端口
+        for _ in range(self.pool_size - 1):
+            lane = CommManager(
+                port,
+                None,
+                batch_mode=True,
+                chunk_size=self.chunk_size,
+                rcvbuf=self.rcvbuf,
+                reassembly_timeout=self.reassembly_timeout,
+                reliable_options=self.reliable_options,
+                pool_size=1,
+            )
+            lane.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            # 共享出口状态：消息汇入同一个队列，对端能力表共用
+            lane.inbox = self.inbox
+            lane._peer_caps = self._peer_caps
+            err = lane.start()
+            if err is not True:
+                print(f"Receive Pool Failed: {err}")
+                lane.close()
+                break
+            # 对方回的 ACK 可能落到任一 socket，统一交给主实例的可靠通道（在 start 之后设置，避免 lane 再开重传线程）
+            lane.reliable = self.reliable
+            self.lanes.append(lane)
+
+    @property
+    def expired_messages(self):
+        return self.reassembler.expired
+
+    def total(self, counter):
+        """汇总接收池中所有 socket 的计数器，例如 total("dropped")"""
+        return getattr(self, counter) + sum(getattr(lane, counter) for lane in self.lanes)
+
     def _receive_loop(self):
+        self.sock.settimeout(1.0)  # 定期醒来清理超时的分片
         while self.running:
             try:
-                data, addr = self.sock.recvfrom(4096)
-                msg = data.decode("utf-8")
-                # 通过回调通知主程序，将 data 和 sender_ip 传出去
-                if self.on_message_received:
-                    self.on_message_received(msg, addr[0])
-            except:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                self.reassembler.expire()
+                continue
+            except OSError:
+                if not self.running:
+                    break  # socket 已关闭
+                continue  # 例如 Windows 上对端不可达引起的 ConnectionResetError
+            self._handle_datagram(data, addr)
+            self._flush_acks()
+
+    def _batch_receive_loop(self):
+        # 非阻塞 + selectors：每次可读时把内核队列里的数据报全部读完（recvmmsg 风格）
+        self.sock.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        last_expire = time.monotonic()
+        try:
+            while self.running:
+                if sel.select(timeout=0.5):
+                    self._drain_socket()
+                now = time.monotonic()
+                if now - last_expire > 1.0:
+                    self.reassembler.expire(now)
+                    last_expire = now
+        except (OSError, ValueError):
+            pass  # socket 已关闭
+        finally:
+            sel.close()
+
+    def _drain_socket(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                self._flush_acks()
+                return
+            except (ConnectionResetError, ConnectionRefusedError):
+                continue  # 对端不可达的 ICMP 回报
+            self._handle_datagram(data, addr)
+
+    def _handle_datagram(self, data, addr):
+        frame = protocol.parse(data)
+        if frame is None:
+            # 兼容旧版客户端：不带帧头的数据报按整条 UTF-8 文本处理
+            payload = data
+        else:
+            flags, msg_id, seq, total, body = frame
+            caps = flags & protocol.FLAG_CAN_COMPRESS
+            if self._peer_caps.get(addr, -1) < caps:
+                self._peer_caps[addr] = caps  # 首个带帧头的数据报即表明对方支持分帧
+            if flags & protocol.FLAG_ACK:
+                if self.reliable:
+                    self._sendto_all(self.reliable.on_ack(addr, body), addr)
+                return
+            is_reliable = flags & protocol.FLAG_RELIABLE
+            if is_reliable:
+                # 无论是否重复都要回 ACK（上一次的 ACK 可能丢了）
+                self._pending_acks.setdefault(addr, []).append((msg_id, seq))
+                if self._dedup.is_duplicate(addr, msg_id):
+                    return
+            payload = self.reassembler.feed((addr, is_reliable), msg_id, seq, total, body, reliable=bool(is_reliable))
+            if payload is None:
+                return  # 分片未收齐
+            if is_reliable:
+                self._dedup.mark_done(addr, msg_id)
+            if flags & protocol.FLAG_COMPRESSED:
+                start = time.perf_counter()
+                try:
+                    payload = protocol.decompress(payload)
+                except ValueError:
+                    self.decode_errors += 1
+                    return
+                stats.observe("codec.decompress", (time.perf_counter() - start) * 1000)
+        self._deliver(payload.decode("utf-8", errors="replace"), addr[0])
+
+    def _flush_acks(self):
+        if not self._pending_acks:
+            return
+        pending, self._pending_acks = self._pending_acks, {}
+        for addr, pairs in pending.items():
+            self._sendto_all(make_acks(pairs, protocol.FLAG_CAN_COMPRESS), addr)
+
+    def _sendto_all(self, datagrams, addr):
+        for datagram in datagrams:
+            try:
+                self.sock.sendto(datagram, addr)
+            except OSError as e:
+                print(f"Send Error: {e}")
+                return
+
+    def _retransmit_loop(self):
+        while self.running:
+            time.sleep(0.01)
+            for datagram, addr in self.reliable.poll():
+                self._sendto_all([datagram], addr)
+
+    def _deliver(self, msg, ip):
+        if not self.batch_mode:
+            # 通过回调通知主程序，将 data 和 sender_ip 传出去
+            if self.on_message_received:
+                self.on_message_received(msg, ip)
+            return
+        try:
+            self.inbox.put_nowait((msg, ip))
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self, max_items=None):
+        """主线程调用：取走当前队列中的全部（或至多 max_items 条）消息"""
+        batch = []
+        while max_items is None or len(batch) < max_items:
+            try:
+                batch.append(self.inbox.get_nowait())
+            except queue.Empty:
                 break
+        return batch
+
+    def _encode(self, msg, target_addr):
+        """返回 (数据, 附加 flags)：对方支持且消息足够长时压缩"""
+        payload = msg.encode("utf-8")
+        flags = protocol.FLAG_CAN_COMPRESS
+        self.bytes_raw += len(payload)
+        if self.compress_threshold and len(payload) >= self.compress_threshold and self._peer_caps.get(target_addr):
+            start = time.perf_counter()
+            packed = protocol.compress(payload, self.compress_level)
+            stats.observe("codec.compress", (time.perf_counter() - start) * 1000)
+            if packed is not None:
+                payload = packed
+                flags |= protocol.FLAG_COMPRESSED
+        self.bytes_wire += len(payload)
+        return payload, flags
+
+    def mark_framed(self, addr, caps=protocol.FLAG_CAN_COMPRESS):
+        """从其他渠道（组播信标）得知对端是新版本时调用，此后直接使用分帧协议"""
+        if self._peer_caps.get(addr, -1) < caps:
+            self._peer_caps[addr] = caps
+
+    def _send_legacy(self, msg, target_addr, token):
+        # 旧版格式：整条 UTF-8 文本，超长时按字符边界拆成多条；无法确认送达，状态回报为 None
+        payload = msg.encode("utf-8")
+        self.bytes_raw += len(payload)
+        self.bytes_wire += len(payload)
+        self._sendto_all(protocol.split_legacy(payload), target_addr)
+        if token is not None and self.reliable and self.reliable.on_status:
+            self.reliable.on_status(token, None)
 
-    def send(self, msg, target_addr):
+    @stats.timed("net.send")
+    def send(self, msg, target_addr, token=None):
+        """token 仅在可靠模式下使用：送达或失败时作为 on_status 的第一个参数回传"""
         try:
-            self.sock.sendto(msg.encode("utf-8"), target_addr)
+            if not self.frame_unknown_peers and target_addr not in self._peer_caps:
+                self._send_legacy(msg, target_addr, token)
+                return
+            payload, flags = self._encode(msg, target_addr)
+            if self.reliable:
+                datagrams = self.reliable.send(payload, target_addr, self.chunk_size, token, flags=flags)
+            else:
+                datagrams = protocol.fragment(payload, next(self._msg_ids) & 0xFFFFFFFF, self.chunk_size, flags)
+            self._sendto_all(datagrams, target_addr)
         except Exception as e:
             print(f"Send Error: {e}")
 
     def close(self):
         self.running = False
         self.sock.close()
+        for lane in self.lanes:
+            lane.close()
@@ -0,0 +1,71 @@
+# platform_support.py
+# (基建层)：平台适配
+# Windows 专属的窗口修补（深色标题栏、任务栏图标、DPI 感知）都放在这里，
+# ctypes 只在 Windows 上、第一次真正用到时才导入，其他平台为空实现
+import sys
+
+_platform = None
+
+
+class Platform:
+    """通用平台：所有修补均为空操作"""
+
+    def enable_dpi_awareness(self):
+        pass
+
+    def apply_title_bar(self, root, dark=True):
+        pass
+
+    def force_taskbar_icon(self, root):
+        """返回 True 表示为此隐藏并重新显示了窗口（会产生一对 Unmap / Map 事件）"""
+        return False
+
+
+class WindowsPlatform(Platform):
+    GWL_EXSTYLE = -20
+    WS_EX_APPWINDOW = 0x00040000
+    WS_EX_TOOLWINDOW = 0x00000080
+    DWMWA_USE_IMMERSIVE_DARK_MODE = 20  # Windows 11 / Windows 10 2004+
+
+    def enable_dpi_awareness(self):
+        try:
+            from ctypes import windll
+
+            windll.shcore.SetProcessDpiAwareness(1)
+        except Exception:
+            pass
+
+    def apply_title_bar(self, root, dark=True):
+        """强制应用 Windows 深色/浅色标题栏属性，保持系统圆角"""
+        try:
+            from ctypes import windll, c_int, byref, sizeof
+
+            hwnd = windll.user32.GetParent(root.winfo_id())
+            value = c_int(1 if dark else 0)
+            windll.dwmapi.DwmSetWindowAttribute(hwnd, self.DWMWA_USE_IMMERSIVE_DARK_MODE, byref(value), sizeof(value))
+        except Exception:
+            pass  # 系统版本过低忽略
+
+    def force_taskbar_icon(self, root):
+        """无边框 (overrideredirect) 窗口默认不显示任务栏图标，这里强制改为 APPWINDOW"""
+        try:
+            from ctypes import windll
+
+            hwnd = windll.user32.GetParent(root.winfo_id())
+            style = windll.user32.GetWindowLongW(hwnd, self.GWL_EXSTYLE)
+            style = style & ~self.WS_EX_TOOLWINDOW
+            style = style | self.WS_EX_APPWINDOW
+            windll.user32.SetWindowLongW(hwnd, self.GWL_EXSTYLE, style)
+            root.wm_withdraw()
+            root.after(10, lambda: root.wm_deiconify())
+            return True
+        except Exception as e:
+            print(f"Force Taskbar Icon Failed: {e}")
+            return False
+
+
+def get_platform():
+    global _platform
+    if _platform is None:
+        _platform = WindowsPlatform() if sys.platform == "win32" else Platform()
+    return _platform
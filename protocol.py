@@ -0,0 +1,148 @@
+# protocol.py
+# (网络层)：UDP 报文的分帧协议
+# 每个数据报 = 12 字节帧头 + 分片数据，超过单片大小的消息拆成多片发送，接收端按消息 id 重组
+# 较长的消息可压缩成信封 (codec + 压缩数据) 再分片，只发给声明过能解压的对端
+# 旧版客户端只认整条 UTF-8 文本（且遇到解码失败会停止接收），只对发来过带帧头数据报的对端使用本协议
+import struct
+import time
+import zlib
+
+MAGIC = b"GC"
+VERSION = 1
+
+# 帧头: magic(2s) version(B) flags(B) msg_id(I) seq(H) total(H)
+HEADER = struct.Struct("!2sBBIHH")
+HEADER_SIZE = HEADER.size
+
+LEGACY_MAX = 4096  # 旧版客户端的接收缓冲区大小，更长的数据报会被截断，截断处的半个字符会让它解码失败
+
+MAX_CHUNKS = 0xFFFF
+
+# flags 位
+FLAG_RELIABLE = 0x01  # 需要对方回 ACK
+FLAG_ACK = 0x02  # 确认报文，数据部分为若干 (msg_id, seq)
+# 早期的分帧实现只检查上面两位，新增的位对它们透明；不认识帧头的旧版客户端根本收不到分帧数据（见 split_legacy）
+FLAG_CAN_COMPRESS = 0x04  # 能力声明：发送方能解压 FLAG_COMPRESSED 的消息，每个数据报都带上
+FLAG_COMPRESSED = 0x08  # 重组后的数据是压缩信封: codec(B) + 压缩数据
+
+# === 压缩信封 ===
+CODEC_ZLIB = 1  # raw deflate + PRESET_DICT
+MAX_DECOMPRESSED = 16 * 1024 * 1024  # 解压结果上限，防止压缩炸弹
+
+# 预置字典：双方内置同一份常用短语，短消息也能引用到重复片段；最常用的放在末尾（离数据最近）
+# 修改内容必须同时换一个新的 codec 编号，否则新旧版本解出的内容不一致
+PRESET_DICT = (
+    "https:// http:// www. .com .cn .html .py .txt .json "
+    "Traceback (most recent call last):\n  File \"\", line , in \nError: Exception "
+    "def return import from class self None True False print( "
+    "the and that this with for you are have not what will can please thanks "
+    "好的 收到 谢谢 没问题 明天 今天 下午 上午 会议 项目 文件 发送 一下 可以 "
+    "我们 你们 他们 这个 那个 什么 怎么 为什么 因为 所以 但是 如果 已经 还是 "
+    "的 了 是 在 我 你 他 吗 吧 呢 啊 ，。！？：；、“”（）"
+).encode("utf-8")
+
+
+def split_legacy(payload, limit=LEGACY_MAX):
+    """发给旧版客户端的纯文本：在 UTF-8 字符边界切成不超过 limit 字节的若干数据报"""
+    parts, pos = [], 0
+    while len(payload) - pos > limit:
+        end = pos + limit
+        while payload[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(payload[pos:end])
+        pos = end
+    parts.append(payload[pos:])
+    return parts
+
+
+def fragment(payload, msg_id, chunk_size, flags=0):
+    """把一条消息拆成若干带帧头的数据报"""
+    total = max(1, -(-len(payload) // chunk_size))
+    if total > MAX_CHUNKS:
+        raise ValueError(f"message too large: {len(payload)} bytes")
+    return [
+        HEADER.pack(MAGIC, VERSION, flags, msg_id, seq, total) + payload[seq * chunk_size : (seq + 1) * chunk_size]
+        for seq in range(total)
+    ]
+
+
+def parse(datagram):
+    """解析帧头，返回 (flags, msg_id, seq, total, body)；不是本协议的数据报（旧版客户端的裸文本）返回 None"""
+    if len(datagram) < HEADER_SIZE or datagram[:2] != MAGIC:
+        return None
+    magic, version, flags, msg_id, seq, total = HEADER.unpack_from(datagram)
+    if version != VERSION or total == 0 or seq >= total:
+        return None
+    return flags, msg_id, seq, total, datagram[HEADER_SIZE:]
+
+
+def compress(payload, level=6):
+    """压缩成信封；压缩后没有变小时返回 None，调用方按原文发送"""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=PRESET_DICT)
+    body = c.compress(payload) + c.flush()
+    if len(body) + 1 >= len(payload):
+        return None
+    return bytes((CODEC_ZLIB,)) + body
+
+
+def decompress(envelope):
+    """解开压缩信封，codec 未知或数据损坏时抛出 ValueError"""
+    if not envelope or envelope[0] != CODEC_ZLIB:
+        raise ValueError(f"unknown codec: {envelope[:1]!r}")
+    d = zlib.decompressobj(-15, zdict=PRESET_DICT)
+    try:
+        payload = d.decompress(envelope[1:], MAX_DECOMPRESSED)
+    except zlib.error as e:
+        raise ValueError(str(e)) from None
+    if d.unconsumed_tail or not d.eof:
+        raise ValueError("truncated or oversized compressed message")
+    return payload
+
+
+class Reassembler:
+    """
+    分片重组：同一 (发送方地址, msg_id) 的分片收齐后拼回完整消息，超过 timeout 秒没有新分片到达的丢弃。
+    可靠消息的分片在到达时就已 ACK，发送方会据此判定送达，所以其超时取 reliable_timeout（不短于发送方单个分片的重传预算）
+    """
+
+    def __init__(self, timeout=5.0, max_pending=4096, reliable_timeout=None):
+        self.timeout = timeout
+        self.reliable_timeout = max(timeout, reliable_timeout or 0)
+        self.max_pending = max_pending
+        self._pending = {}  # (addr, msg_id) -> [parts, received, last_seen, timeout]
+        self.expired = 0  # 超时丢弃的不完整消息数
+
+    def feed(self, addr, msg_id, seq, total, body, now=None, reliable=False):
+        if total == 1:
+            return body
+        if now is None:
+            now = time.monotonic()
+        key = (addr, msg_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self.expire(now, force=True)
+            timeout = self.reliable_timeout if reliable else self.timeout
+            entry = self._pending[key] = [[None] * total, 0, now, timeout]
+        parts = entry[0]
+        if len(parts) != total or parts[seq] is not None:
+            return None  # 重复分片或帧头不一致
+        parts[seq] = body
+        entry[1] += 1
+        entry[2] = now  # 按最近一次有进展的时间计超时：大消息的后续分片可能要等发送窗口空出才发出
+        if entry[1] < total:
+            return None
+        del self._pending[key]
+        return b"".join(parts)
+
+    def expire(self, now=None, force=False):
+        """清理超时的不完整消息；force=True 时至少清掉最老的一条以腾出空间"""
+        if now is None:
+            now = time.monotonic()
+        stale = [k for k, e in self._pending.items() if now - e[2] > e[3]]
+        if force and not stale and self._pending:
+            stale = [min(self._pending, key=lambda k: self._pending[k][2])]
+        for k in stale:
+            del self._pending[k]
+        self.expired += len(stale)
+        return len(stale)
@@ -0,0 +1,174 @@
+# reliable.py
+# (网络层)：UDP 之上的可靠传输
+# 每个对端独立的消息序号 + 选择确认 (SACK) + 按 RTT 估算的重传定时器 + 发送窗口
+# 本模块只维护状态、产出待发送的数据报，不直接操作 socket，线程版和 asyncio 版网络层都可复用
+import struct
+import threading
+import time
+from collections import deque
+
+import protocol
+
+_ACK_ENTRY = struct.Struct("!IH")  # (msg_id, seq)
+MAX_ACKS_PER_DATAGRAM = 200
+
+
+def make_acks(pairs, flags=0):
+    """把若干 (msg_id, seq) 打包成 ACK 数据报（一个数据报可确认多个分片），flags 附加在 FLAG_ACK 之上"""
+    datagrams = []
+    for i in range(0, len(pairs), MAX_ACKS_PER_DATAGRAM):
+        body = b"".join(_ACK_ENTRY.pack(m, s) for m, s in pairs[i : i + MAX_ACKS_PER_DATAGRAM])
+        datagrams.append(protocol.HEADER.pack(protocol.MAGIC, protocol.VERSION, protocol.FLAG_ACK | flags, 0, 0, 1) + body)
+    return datagrams
+
+
+def parse_acks(body):
+    usable = len(body) - len(body) % _ACK_ENTRY.size
+    return [_ACK_ENTRY.unpack_from(body, i) for i in range(0, usable, _ACK_ENTRY.size)]
+
+
+class _PeerState:
+    def __init__(self, first_id, initial_rto):
+        self.next_id = first_id
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.inflight = {}  # (msg_id, seq) -> [datagram, sent_at, retries]
+        self.backlog = deque()  # 等待窗口空出的分片: (msg_id, seq, datagram)
+        self.messages = {}  # msg_id -> [未确认分片数, token]
+
+
+class ReliableChannel:
+    """
+    发送端：send() 返回本次可立即发出的数据报，其余进入发送窗口队列；
+    on_ack() / poll() 返回因窗口释放或超时需要发送的数据报。
+    on_status(token, "delivered" / "failed") 在消息全部确认或重传耗尽时调用（在调用方线程中）。
+    接收端：is_duplicate() / mark_done() 过滤重传造成的重复消息。
+    """
+
+    def __init__(self, on_status=None, window=64, max_retries=8, min_rto=0.05, max_rto=2.0, initial_rto=0.3):
+        self.on_status = on_status
+        self.window = window
+        self.max_retries = max_retries
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.initial_rto = initial_rto
+        self._peers = {}
+        self._lock = threading.Lock()
+        self._done = {}  # addr -> (deque, set)，最近已交付的可靠消息 id
+        self.retransmits = 0
+
+    def _peer(self, addr):
+        peer = self._peers.get(addr)
+        if peer is None:
+            peer = self._peers[addr] = _PeerState(int(time.time() * 1000) & 0xFFFFFFFF, self.initial_rto)
+        return peer
+
+    @property
+    def retransmit_budget(self):
+        """单个分片从首次发出到判定失败的最长时间（每次等待不超过 max_rto）"""
+        return (self.max_retries + 1) * self.max_rto
+
+    # ================= 发送端 =================
+    def send(self, payload, addr, chunk_size, token=None, now=None, flags=0):
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            peer = self._peer(addr)
+            msg_id = peer.next_id
+            peer.next_id = (peer.next_id + 1) & 0xFFFFFFFF
+            datagrams = protocol.fragment(payload, msg_id, chunk_size, protocol.FLAG_RELIABLE | flags)
+            peer.messages[msg_id] = [len(datagrams), token]
+            peer.backlog.extend((msg_id, seq, d) for seq, d in enumerate(datagrams))
+            return self._fill_window(peer, now)
+
+    def _fill_window(self, peer, now):
+        out = []
+        while peer.backlog and len(peer.inflight) < self.window:
+            msg_id, seq, datagram = peer.backlog.popleft()
+            if msg_id not in peer.messages:
+                continue  # 该消息已判定失败
+            peer.inflight[(msg_id, seq)] = [datagram, now, 0]
+            out.append(datagram)
+        return out
+
+    def on_ack(self, addr, body, now=None):
+        if now is None:
+            now = time.monotonic()
+        finished = []
+        with self._lock:
+            peer = self._peers.get(addr)
+            if peer is None:
+                return []
+            for key in parse_acks(body):
+                entry = peer.inflight.pop(key, None)
+                if entry is None:
+                    continue
+                if entry[2] == 0:
+                    self._update_rtt(peer, now - entry[1])  # Karn 算法：重传过的分片不参与 RTT 采样
+                msg = peer.messages.get(key[0])
+                if msg is not None:
+                    msg[0] -= 1
+                    if msg[0] == 0:
+                        del peer.messages[key[0]]
+                        finished.append((msg[1], "delivered"))
+            out = self._fill_window(peer, now)
+        self._report(finished)
+        return out
+
+    def _update_rtt(self, peer, sample):
+        # RFC 6298: SRTT / RTTVAR 平滑估计
+        if peer.srtt is None:
+            peer.srtt = sample
+            peer.rttvar = sample / 2
+        else:
+            peer.rttvar = 0.75 * peer.rttvar + 0.25 * abs(peer.srtt - sample)
+            peer.srtt = 0.875 * peer.srtt + 0.125 * sample
+        peer.rto = min(self.max_rto, max(self.min_rto, peer.srtt + 4 * peer.rttvar))
+
+    def poll(self, now=None):
+        """定时调用：返回需要重传的 [(datagram, addr), ...]"""
+        if now is None:
+            now = time.monotonic()
+        out, finished = [], []
+        with self._lock:
+            for addr, peer in self._peers.items():
+                failed = set()
+                for key, entry in peer.inflight.items():
+                    datagram, sent_at, retries = entry
+                    # 指数退避
+                    if now - sent_at < min(self.max_rto, peer.rto * (2**retries)):
+                        continue
+                    if retries >= self.max_retries:
+                        failed.add(key[0])
+                        continue
+                    entry[1] = now
+                    entry[2] += 1
+                    self.retransmits += 1
+                    out.append((datagram, addr))
+                for msg_id in failed:
+                    for key in [k for k in peer.inflight if k[0] == msg_id]:
+                        del peer.inflight[key]
+                    finished.append((peer.messages.pop(msg_id)[1], "failed"))
+                if failed:
+                    out.extend((d, addr) for d in self._fill_window(peer, now))
+        self._report(finished)
+        return out
+
+    def _report(self, finished):
+        if self.on_status:
+            for token, status in finished:
+                if token is not None:
+                    self.on_status(token, status)
+
+    # ================= 接收端 =================
+    def is_duplicate(self, addr, msg_id):
+        done = self._done.get(addr)
+        return done is not None and msg_id in done[1]
+
+    def mark_done(self, addr, msg_id, keep=4096):
+        order, ids = self._done.setdefault(addr, (deque(), set()))
+        order.append(msg_id)
+        ids.add(msg_id)
+        if len(order) > keep:
+            ids.discard(order.popleft())
@@ -7,6 +7,68 @@ import os
 PORT = 9999
 DEFAULT_TARGET_IP = "127.0.0.1"
 
+# === 接收性能配置 ===
+RECV_QUEUE_SIZE = 10000  # 接收队列上限，超出后丢弃并计数
+RECV_BATCH_MAX = 2000  # 每帧最多处理的消息条数，防止一次卡住主线程
+FRAME_INTERVAL_MS = 16  # 主线程轮询间隔（约 60 帧/秒）
+BACKGROUND_FRAME_MS = 250  # 窗口最小化时的轮询间隔，只入库和计未读
+RECV_SOCKET_BUFFER = 4 * 1024 * 1024  # SO_RCVBUF，突发流量时内核可缓存的字节数
+
+RECV_POOL_SIZE = 1  # 接收 socket 数量，>1 时用 SO_REUSEPORT 绑定多个 socket 分担收包（Linux / BSD / macOS，Windows 上固定为 1）
+NETWORK_ENGINE = "thread"  # "thread": 阻塞 socket + 接收线程；"asyncio": 单事件循环线程 (AsyncCommManager)
+
+# === 分帧传输 ===
+CHUNK_SIZE = 1400  # 单个数据报携带的最大数据量，长消息按此拆片（低于以太网 MTU，避免 IP 分片）
+REASSEMBLY_TIMEOUT = 5.0  # 分片在此秒数内未收齐则整条丢弃
+FRAME_UNKNOWN_PEERS = False  # False: 对端发来过新协议数据报（或组播信标）之前按旧版纯文本发送，兼容旧版客户端；网络里没有旧版时可设为 True
+
+# === 压缩 ===
+COMPRESS_THRESHOLD = 512  # 不小于此字节数的消息压缩后发送（仅限声明支持压缩的对端），0 为关闭
+COMPRESS_LEVEL = 6  # zlib 压缩级别 1~9
+
+# === 可靠传输（ACK + 重传）===
+RELIABLE_MODE = False  # 开启后发送的消息需对方确认，记录上会标注 pending / delivered / failed
+RELIABLE_OPTIONS = {
+    "window": 64,  # 每个对端最多同时在途的分片数
+    "max_retries": 8,  # 单个分片最多重传次数，超过则整条消息判定失败
+    "min_rto": 0.05,  # 重传超时下限（秒），实际值按 RTT 估算
+    "max_rto": 2.0,
+}
+
+# === 局域网发现与群聊（组播）===
+DISCOVERY_ENABLED = False  # 开启后每隔 BEACON_INTERVAL 秒向局域网组播本机名称，自动把其他实例加入联系人，并显示群聊；默认关闭，需要时手动打开
+LOCAL_NAME = None  # 信标和群聊中显示的本机名称，None 时使用主机名
+MULTICAST_GROUP = "239.255.42.99"  # 组织内部范围 (239.255.0.0/16)
+MULTICAST_PORT = 9998
+MULTICAST_TTL = 1  # 只在本网段内传播
+BEACON_INTERVAL = 5.0  # 信标间隔（秒）
+PEER_EXPIRY = 15.0  # 超过此秒数没有收到信标的自动联系人会被移除
+GROUP_NAME = "局域网群聊"  # 群聊在联系人列表中的名称
+
+# === 命令行配置 ===
+CMD_WHITELIST = ["dir", "ipconfig", "ping", "ver", "whoami", "echo"]
+CMD_TIMEOUT = 30  # 单条命令最长执行秒数，超时自动终止
+CMD_MAX_LINES = 5000  # CMD 输出区最多保留的行数，超出后裁掉最早的行
+CMD_ENCODING = "gbk" if os.name == "nt" else "utf-8"
+
+# === 聊天记录存储 ===
+HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db")
+HISTORY_LOAD_LIMIT = 200  # 启动时每个联系人加载的最近记录条数
+HISTORY_PAGE_SIZE = 100  # 切换联系人时只渲染最后一页，向上滚动时按页补齐
+HISTORY_MAX_LIVE = 500  # Text 中最多同时存在的记录条数
+HISTORY_RING_SIZE = 1000  # 每个联系人在内存中最多保留的记录条数，更早的记录滚动到时再从数据库读回
+HISTORY_MEMORY_CAP = 32 * 1024 * 1024  # 所有会话内存记录的总字节上限（估算），超出后从最久未活跃的会话开始淘汰
+HISTORY_SEARCH_SCAN = 100000  # 单字等没有索引可用的搜索只扫描最近这么多条记录
+
+# === WPS 文档 ===
+DOC_CHUNK_BYTES = 64 * 1024  # 打开文件时按此字节数在换行处切块，分帧插入编辑区
+DOC_SLICE_MS = 12  # 每帧插入文档的时间预算，用完后把控制权还给事件循环
+DOC_ENCODING = "utf-8"
+
+# === 性能统计（可选）===
+INSTRUMENTATION = False  # 开启后对热路径计时 / 计数，CMD 模式输入 stats 查看，Normal 模式按 F9 显示悬浮面板
+STATS_PROBE_MS = 100  # Tk 事件队列延迟探针的间隔
+
 # === 图标配置 ===
 # 请确保这些图片文件存在于项目根目录下
 ICONS = {
@@ -36,6 +98,7 @@ COLOR_SCHEMES = {
         "fg_self": "#98e165",
         "bg_self": "#191919",
         "border": "#333",
+        "fg_unread": "#fa5151",  # 有未读消息的联系人
     },
     "light": {
         "bg_root": "#f5f5f5",
@@ -48,6 +111,7 @@ COLOR_SCHEMES = {
         "fg_self": "black",
         "bg_self": "#95ec69",
         "border": "#dcdcdc",
+        "fg_unread": "#fa5151",
     },
 }
 THEMES = {
@@ -55,6 +119,7 @@ THEMES = {
         "bg_root": "#0c0c0c",
         "fg_primary": "#cccccc",
         "fg_error": "#ff3333",
+        "fg_stats": "#6a9955",
         "font_main": ("Consolas", 11),
         "title": "Administrator: Windows PowerShell",
     },
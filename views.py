@@ -1,8 +1,12 @@
 # views.py
+import os
 import tkinter as tk
-from tkinter import simpledialog, colorchooser, font, ttk
-from settings import THEMES, COLOR_SCHEMES
-from components import SmartScrollbar, WindowsTitleBarFix
+from tkinter import simpledialog, colorchooser, filedialog, messagebox, font, ttk
+from settings import THEMES, COLOR_SCHEMES, HISTORY_PAGE_SIZE, HISTORY_MAX_LIVE, FRAME_INTERVAL_MS, CMD_MAX_LINES
+from settings import DOC_CHUNK_BYTES, DOC_SLICE_MS, DOC_ENCODING
+from components import SmartScrollbar, HistoryWindow, SearchPopup, RenderScheduler, StyleRegistry, DocumentFile, ThemeBinder
+from platform_support import get_platform
+from instrumentation import stats
 
 
 # === CMD 视图 ===
@@ -13,7 +17,7 @@ class CmdView(tk.Frame):
 
         # 尝试应用 Win11 深色标题栏
         self.master.update_idletasks()
-        WindowsTitleBarFix.apply_dark_title_bar(self.master)
+        get_platform().apply_title_bar(self.master, dark=True)
 
         # 输出区
         self.text_area = tk.Text(
@@ -28,6 +32,7 @@ class CmdView(tk.Frame):
         self.text_area.pack(side="top", fill="both", expand=True)
         self.text_area.tag_config("cmd_text", foreground=THEMES["cmd"]["fg_primary"])
         self.text_area.tag_config("cmd_err", foreground=THEMES["cmd"]["fg_error"])
+        self.text_area.tag_config("cmd_stats", foreground=THEMES["cmd"]["fg_stats"])
 
         # 窄滚动条
         sb = SmartScrollbar(
@@ -40,32 +45,45 @@ class CmdView(tk.Frame):
         )
         sb.place(relx=1.0, rely=0, relheight=1.0, anchor="ne")
         self.text_area.config(yscrollcommand=sb.set)
+        # 输出按帧合并写入，超过 CMD_MAX_LINES 的旧行自动裁掉
+        self.scheduler = RenderScheduler(self.text_area, sb, FRAME_INTERVAL_MS, CMD_MAX_LINES, on_flush=self._on_flush)
 
         # 绑定事件
         self.text_area.bind("<Return>", self._on_return)
+        self.text_area.bind("<Control-c>", self._on_ctrl_c)
         self.text_area.bind("<Button-1>", lambda e: self.text_area.focus_set())
         self.input_mark = "1.0"
 
+    def on_show(self):
+        """视图从缓存中重新显示时调用"""
+        self.master.update_idletasks()
+        get_platform().apply_title_bar(self.master, dark=True)
+
     def _on_return(self, event):
+        self.scheduler.flush()  # 先写完缓冲中的输出，input_mark 才是最新的
         user_input = self.text_area.get(self.input_mark, "end-1c").strip()
         self.text_area.insert("end", "\n")
         self.text_area.see("end")
         self.controller.handle_cmd_input(user_input)
         return "break"
 
+    def _on_ctrl_c(self, event):
+        # 有命令在执行时取消它；否则保留默认的复制行为
+        if self.controller.cancel_command():
+            return "break"
+        return None
+
     def log(self, text, tag="cmd_text", no_newline=False):
-        self.text_area.config(state="normal")
-        self.text_area.insert("end", text + ("" if no_newline else "\n"), tag)
-        self.text_area.see("end")
-        self.input_mark = self.text_area.index("end-1c")
+        self.scheduler.write(text + ("" if no_newline else "\n"), tag)
 
     def prompt(self, text):
-        self.text_area.config(state="normal")
-        self.text_area.insert("end", text, "cmd_text")
-        self.text_area.see("end")
+        self.scheduler.write(text, "cmd_text")
+
+    def _on_flush(self, follow):
         self.input_mark = self.text_area.index("end-1c")
 
     def clear(self):
+        self.scheduler.discard()
         self.text_area.config(state="normal")
         self.text_area.delete("1.0", tk.END)
         self.input_mark = "1.0"
@@ -74,9 +92,14 @@ class CmdView(tk.Frame):
     def reset_chat_area(self):
         self.clear()
 
-    # 增加 append_msg 方法以兼容 main.py 的调用
-    def append_msg(self, record, sender_name):
-        log_text = f"Reply from {sender_name}: bytes={len(record['msg'])} time={record['time']} data={record['msg']}"
+    # 增加 append_msg 方法以兼容 main.py 的调用（支持单条记录或记录列表）
+    @stats.timed("cmd.append_msg")
+    def append_msg(self, records, sender_name):
+        if not isinstance(records, (list, tuple)):
+            records = [records]
+        log_text = "\n".join(
+            f"Reply from {sender_name}: bytes={len(rec['msg'])} time={rec['time']} data={rec['msg']}" for rec in records
+        )
         self.log(log_text, "cmd_text")
         # 补一个提示符
         self.log(f"{self.controller.current_path}>", "cmd_text", True)
@@ -85,76 +108,66 @@ class CmdView(tk.Frame):
 # === Normal 视图 ===
 class NormalView(tk.Frame):
     def __init__(self, master, controller, is_dark=True):
-        self.colors = COLOR_SCHEMES["dark"] if is_dark else COLOR_SCHEMES["light"]
-        super().__init__(master, bg=self.colors["bg_root"])
+        super().__init__(master)
         self.controller = controller
+        # 颜色都经 theme 登记，切换深浅色时由 apply_scheme 原地重设
+        self.theme = ThemeBinder(COLOR_SCHEMES, is_dark)
+        self.theme(self, bg="bg_root")
 
         # 发送模式变量，默认 Enter 发送
         self.send_mode_var = tk.StringVar(value="Enter")
 
         self.master.update_idletasks()
-        if is_dark:
-            WindowsTitleBarFix.apply_dark_title_bar(self.master)
-        else:
-            WindowsTitleBarFix.apply_light_title_bar(self.master)
+        get_platform().apply_title_bar(self.master, dark=is_dark)
 
-        paned = tk.PanedWindow(self, orient="horizontal", bg=self.colors["bg_sidebar"], sashwidth=1)
+        paned = self.theme(tk.PanedWindow(self, orient="horizontal", sashwidth=1), bg="bg_sidebar")
         paned.pack(fill="both", expand=True)
 
         # --- 左侧联系人：宽度调整为 280 (原220)，从而让右侧看起来更窄 ---
-        sidebar = tk.Frame(paned, width=150, bg=self.colors["bg_sidebar"])
+        sidebar = self.theme(tk.Frame(paned, width=150), bg="bg_sidebar")
         paned.add(sidebar)
 
         # 搜索框区域
-        search_frm = tk.Frame(sidebar, bg="#262626" if is_dark else "#e0e0e0", height=40)
+        search_bg = ("#262626", "#e0e0e0")
+        search_frm = self.theme(tk.Frame(sidebar, height=40), bg=search_bg)
         search_frm.pack(fill="x", padx=10, pady=10)
 
         self.search_var = tk.StringVar()
         self.search_var.trace("w", lambda *a: self.controller.filter_contacts(self.search_var.get()))
 
-        tk.Entry(
-            search_frm,
-            textvariable=self.search_var,
-            bg=self.colors["bg_input"],
-            fg=self.colors["fg_primary"],
-            bd=0,
-        ).pack(side="left", fill="x", expand=True, ipady=3, padx=5)
+        # 输入时过滤联系人；回车在聊天记录中全文搜索
+        self.search_entry = self.theme(
+            tk.Entry(search_frm, textvariable=self.search_var, bd=0),
+            bg="bg_input",
+            fg="fg_primary",
+        )
+        self.search_entry.pack(side="left", fill="x", expand=True, ipady=3, padx=5)
+        self.search_entry.bind("<Return>", lambda e: self._open_history_search())
 
-        tk.Button(
-            search_frm,
-            text="+",
-            bg=search_frm["bg"],
-            fg=self.colors["fg_primary"],
-            bd=0,
-            width=2,
-            command=self._add_contact,
+        self.theme(
+            tk.Button(search_frm, text="+", bd=0, width=2, command=self._add_contact),
+            bg=search_bg,
+            fg="fg_primary",
         ).pack(side="right")
 
-        mode_btn_txt = "☀️" if is_dark else "🌙"
-        tk.Button(
-            search_frm,
-            text=mode_btn_txt,
-            bg=search_frm["bg"],
-            fg=self.colors["fg_primary"],
-            bd=0,
-            width=2,
-            command=self.controller.toggle_color_scheme,
-        ).pack(side="right")
+        self.mode_btn = self.theme(
+            tk.Button(search_frm, text="☀️" if is_dark else "🌙", bd=0, width=2, command=self.controller.toggle_color_scheme),
+            bg=search_bg,
+            fg="fg_primary",
+        )
+        self.mode_btn.pack(side="right")
 
         # 联系人列表
         contact_font = ("Microsoft YaHei UI", 14)
         self.contact_list = tk.Listbox(
             sidebar,
-            bg=self.colors["bg_sidebar"],
-            fg=self.colors["fg_primary"],
             bd=0,
             # font=THEMES["normal"]["font_main"],
             font=contact_font,
-            selectbackground=self.colors["bg_select"],
-            selectforeground=self.colors["fg_primary"],
             activestyle="none",  # 去掉选中时的
             highlightthickness=0,  # 去掉选中时的
         )
+        self.theme(self.contact_list, bg="bg_sidebar", fg="fg_primary", selectbackground="bg_select", selectforeground="fg_primary")
         self.contact_list.pack(fill="both", expand=True, padx=5, pady=5)
         self.contact_list.bind("<<ListboxSelect>>", self._on_contact_select)
 
@@ -167,83 +180,78 @@ class NormalView(tk.Frame):
 
         # --- [关键修复] 右侧容器 ---
         # 必须先创建 right_container，再把 main_chat 和 empty_frame 放进去
-        self.right_container = tk.Frame(paned, bg=self.colors["bg_root"])
+        self.right_container = self.theme(tk.Frame(paned), bg="bg_root")
         paned.add(self.right_container)
 
         # 1. 空状态页面
-        self.empty_frame = tk.Frame(self.right_container, bg=self.colors["bg_root"])
-        tk.Label(
-            self.empty_frame,
-            # text="未选择联系人",
-            text="",
-            bg=self.colors["bg_root"],
-            fg=self.colors["fg_primary"],
-            font=("微软雅黑", 14),
+        self.empty_frame = self.theme(tk.Frame(self.right_container), bg="bg_root")
+        self.theme(
+            tk.Label(
+                self.empty_frame,
+                # text="未选择联系人",
+                text="",
+                font=("微软雅黑", 14),
+            ),
+            bg="bg_root",
+            fg="fg_primary",
         ).place(relx=0.5, rely=0.5, anchor="center")
 
         # 2. 聊天页面
-        self.main_chat = tk.Frame(self.right_container, bg=self.colors["bg_root"])
+        self.main_chat = self.theme(tk.Frame(self.right_container), bg="bg_root")
 
         # 头部
         self.header_label = tk.Label(
             self.main_chat,
             text=self.controller.target_name or "",
-            bg=self.colors["bg_root"],
-            fg=self.colors["fg_primary"],
             font=("微软雅黑", 12, "bold"),
             anchor="w",
             padx=15,
             pady=10,
         )
+        self.theme(self.header_label, bg="bg_root", fg="fg_primary")
         self.header_label.pack(fill="x")
-        tk.Frame(self.main_chat, height=1, bg=self.colors["border"]).pack(fill="x")
+        self.theme(tk.Frame(self.main_chat, height=1), bg="border").pack(fill="x")
 
         # 聊天记录区
         self.text_area = tk.Text(
             self.main_chat,
-            bg=self.colors["bg_root"],
-            fg=self.colors["fg_primary"],
             font=THEMES["normal"]["font_main"],
             wrap="word",
             bd=0,
             padx=10,
             pady=10,
         )
+        self.theme(self.text_area, bg="bg_root", fg="fg_primary")
         self.text_area.pack(fill="both", expand=True)
 
-        self.text_area.tag_config(
-            "normal_self",
-            foreground=self.colors["fg_self"],
-            background=self.colors["bg_self"],
-            justify="right",
-            rmargin=10,
-        )
-        self.text_area.tag_config(
-            "normal_peer",
-            foreground=self.colors["fg_peer"],
-            background=self.colors["bg_peer"],
-            justify="left",
-            lmargin1=10,
-        )
+        self.text_area.tag_config("normal_self", justify="right", rmargin=10)
+        self.theme.tag(self.text_area, "normal_self", foreground="fg_self", background="bg_self")
+        self.text_area.tag_config("normal_peer", justify="left", lmargin1=10)
+        self.theme.tag(self.text_area, "normal_peer", foreground="fg_peer", background="bg_peer")
         self.text_area.tag_config("time_tag", foreground="#888", font=("微软雅黑", 8))
-
-        sb = SmartScrollbar(
-            self.main_chat,
-            command=self.text_area.yview,
-            bg_color=self.colors["bg_root"],
+        self.theme.tag(self.text_area, "search_hit", background=("#5c4a00", "#fff3b0"))
+
+        self.scrollbar = self.theme(SmartScrollbar(self.main_chat, command=self.text_area.yview), bg="bg_root")
+        self.scrollbar.place(relx=1.0, rely=0, relheight=1.0, anchor="ne")
+        self.text_area.config(yscrollcommand=self._on_text_scroll)
+        self.history_window = HistoryWindow(
+            self.text_area,
+            self._record_segments,
+            HISTORY_PAGE_SIZE,
+            HISTORY_MAX_LIVE,
+            scrollbar=self.scrollbar,
+            interval=FRAME_INTERVAL_MS,
         )
-        sb.place(relx=1.0, rely=0, relheight=1.0, anchor="ne")
-        self.text_area.config(yscrollcommand=sb.set)
 
         # 输入区
-        input_frm = tk.Frame(self.main_chat, height=140, bg=self.colors["bg_root"])
+        input_frm = self.theme(tk.Frame(self.main_chat, height=140), bg="bg_root")
         input_frm.pack(fill="x", side="bottom")
         input_frm.pack_propagate(False)  # 防止内部组件改变了 input_frm 的高度
         # 顶部分割线
         # tk.Frame(input_frm, height=1, bg=self.colors["border"]).pack(fill="x")
-        tk.Frame(input_frm, height=1, bg=self.colors["border"]).pack(fill="x", side="top")
+        self.theme(tk.Frame(input_frm, height=1), bg="border").pack(fill="x", side="top")
 
-        input_inner = tk.Frame(input_frm, bg=self.colors["bg_root"])
+        input_inner = self.theme(tk.Frame(input_frm), bg="bg_root")
         input_inner.pack(fill="both", expand=True, padx=15, pady=15)
         # =========== 组合发送按钮和模式选择框 ===========
         send_bg = "#e9e9e9"
@@ -289,21 +297,41 @@ class NormalView(tk.Frame):
         self.send_menu.add_radiobutton(label="Ctrl+Enter", variable=self.send_mode_var, value="Ctrl+Enter 发送")
 
         # === 文本输入框 (左侧) ===
-        self.input_area = tk.Text(
-            input_inner,
-            height=1,
-            bg=self.colors["bg_input"],
-            fg=self.colors["fg_primary"],
-            font=THEMES["normal"]["font_main"],
-            bd=0,
-            insertbackground=self.colors["fg_primary"],
-        )
+        self.input_area = tk.Text(input_inner, height=1, font=THEMES["normal"]["font_main"], bd=0)
+        self.theme(self.input_area, bg="bg_input", fg="fg_primary", insertbackground="fg_primary")
         self.input_area.pack(side="left", fill="both", expand=True)
         self.input_area.bind("<Return>", self._on_return)
 
+        # 性能统计悬浮面板（F9 切换，需开启 INSTRUMENTATION）
+        self.stats_overlay = None
+        self._stats_job = None
+
         # 初始显示空状态
         self.toggle_empty_state(True)
 
+    @property
+    def is_dark(self):
+        return self.theme.is_dark
+
+    @property
+    def colors(self):
+        return self.theme.scheme
+
+    def apply_scheme(self, is_dark):
+        """切换深浅色：原地重设登记过的颜色，未读高亮随 refresh_contacts（on_show）重绘"""
+        self.theme.apply(is_dark)
+        self.mode_btn.config(text="☀️" if is_dark else "🌙")
+        if self.stats_overlay is not None:
+            self.stats_overlay.config(bg="#000000" if is_dark else "#ffffff")
+
+    def on_show(self):
+        """视图从缓存中重新显示时调用：同步标题栏、联系人与搜索状态"""
+        self.master.update_idletasks()
+        get_platform().apply_title_bar(self.master, dark=self.is_dark)
+        if self.search_var.get():
+            self.search_var.set("")  # 触发 filter_contacts 重置 displayed_contacts
+        self.refresh_contacts()
+
     # --- 显示菜单逻辑 ---
     def _show_send_menu(self):
         # 在箭头按钮的左下角弹出菜单
@@ -321,49 +349,130 @@ class NormalView(tk.Frame):
             self.empty_frame.pack_forget()
             self.main_chat.pack(fill="both", expand=True)
 
+    def chat_visible(self):
+        # 未选中联系人时聊天区被空状态页替换，收到的消息不必写入
+        return bool(self.main_chat.winfo_ismapped())
+
+    @stats.timed("normal.render_history")
     def render_history(self, records, target_name):
-        """加载某人的所有历史记录"""
+        """加载某人的历史记录（只渲染最后一页，向上滚动时懒加载）"""
         self.toggle_empty_state(False)
         self.header_label.config(text=target_name)
-
-        self.text_area.config(state="normal")
-        self.text_area.delete("1.0", tk.END)
-
-        for rec in records:
-            self._insert_record(rec, target_name)
-
-        self.text_area.see(tk.END)
+        self.history_window.sync(records, target_name)
         self.text_area.config(state="disabled")
 
-    def append_msg(self, record, sender_name):
+    @stats.timed("normal.append_msg")
+    def append_msg(self, records, sender_name):
+        # 支持单条记录或记录列表：一批消息只做一次插入和一次滚动
+        if not isinstance(records, (list, tuple)):
+            records = [records]
         # 确保聊天界面是显示的
         if not self.main_chat.winfo_ismapped():
             self.toggle_empty_state(False)
 
-        self.text_area.config(state="normal")
-        self._insert_record(record, sender_name)
-        self.text_area.see(tk.END)
+        self.history_window.append(records, sender_name)
+
+    # --- 性能统计悬浮面板 ---
+    def toggle_stats_overlay(self):
+        if self.stats_overlay is not None:
+            self.after_cancel(self._stats_job)
+            self.stats_overlay.destroy()
+            self.stats_overlay = None
+            return
+        self.stats_overlay = tk.Label(
+            self,
+            bg="#000000" if self.is_dark else "#ffffff",
+            fg="#6a9955",
+            font=("Consolas", 9),
+            justify="left",
+            anchor="nw",
+            padx=8,
+            pady=6,
+        )
+        self.stats_overlay.place(relx=1.0, rely=0, x=-20, y=50, anchor="ne")
+        self._refresh_stats_overlay()
+
+    def _refresh_stats_overlay(self):
+        self.stats_overlay.config(text="\n".join(self.controller.stats_overlay_lines()))
+        self.stats_overlay.lift()
+        self._stats_job = self.after(1000, self._refresh_stats_overlay)
+
+    # --- 聊天记录搜索 ---
+    def _open_history_search(self):
+        SearchPopup(
+            self,
+            self.controller.search_history,
+            self.controller.open_search_hit,
+            query=self.search_var.get(),
+            bg=self.colors["bg_input"],
+            fg=self.colors["fg_primary"],
+        )
+
+    def show_search_hit(self, records, target_name, index):
+        """定位到搜索结果：加载该记录附近的一页并高亮"""
+        self.toggle_empty_state(False)
+        self.header_label.config(text=target_name)
+        start, end = self.history_window.load_around(records, target_name, index)
+        self.text_area.tag_add("search_hit", start, end)
+        self.text_area.tag_raise("search_hit")
+        self.text_area.see(start)
         self.text_area.config(state="disabled")
 
-    def _insert_record(self, rec, name_to_display):
+    def _on_text_scroll(self, lo, hi):
+        self.scrollbar.set(lo, hi)
+        self.history_window.on_yscroll(lo, hi)
+
+    def _record_segments(self, rec, name_to_display):
+        # 返回 (文本, 标签, 文本, 标签)，可直接展开给 Text.insert 一次插入多段
         tag = "normal_self" if rec["type"] == "self" else "normal_peer"
         header = f"[{rec['time']}]" if rec["type"] == "self" else f"[{name_to_display} {rec['time']}]"
-
-        self.text_area.insert(tk.END, header + "\n", ("time_tag", tag))
-        self.text_area.insert(tk.END, rec["msg"] + "\n\n", tag)
+        if rec.get("status") == "failed":
+            header += " 未送达"
+        return (header + "\n", ("time_tag", tag), rec["msg"] + "\n\n", tag)
 
     def reset_chat_area(self):
         self.header_label.config(text="未选择联系人")
-        self.text_area.config(state="normal")
-        self.text_area.delete("1.0", tk.END)
+        self.history_window.clear()
         self.text_area.config(state="disabled")
         self.controller.target_addr = None
         self.toggle_empty_state(True)
 
     def refresh_contacts(self):
         self.contact_list.delete(0, tk.END)
-        for c in self.controller.displayed_contacts:
-            self.contact_list.insert(tk.END, f" {c['name']}")
+        sidebar = self.controller.sidebar
+        rows = self.controller.displayed_contacts
+        self.contact_list.insert(tk.END, *(self._contact_label(c, sidebar.unread_for(c)) for c in rows))
+        for i, c in enumerate(rows):
+            if sidebar.unread_for(c):
+                self.contact_list.itemconfig(i, fg=self.colors["fg_unread"])
+
+    @staticmethod
+    def _contact_label(contact, unread):
+        return f" {contact['name']}  ({unread})" if unread else f" {contact['name']}"
+
+    # --- 联系人列表增量更新（由侧栏模型按行调用） ---
+    def insert_contact_row(self, idx, contact, unread=0):
+        self.contact_list.insert(idx, self._contact_label(contact, unread))
+        if unread:
+            self.contact_list.itemconfig(idx, fg=self.colors["fg_unread"])
+
+    def update_contact_row(self, idx, contact, unread=0):
+        selected = idx in self.contact_list.curselection()
+        self.contact_list.delete(idx)
+        self.insert_contact_row(idx, contact, unread)
+        if selected:
+            self.contact_list.selection_set(idx)
+
+    def move_contact_row(self, old, new, contact, unread=0):
+        # 选中行跟着联系人移动，而不是停留在原行号
+        selected = old in self.contact_list.curselection()
+        self.contact_list.delete(old)
+        self.insert_contact_row(new, contact, unread)
+        if selected:
+            self.contact_list.selection_set(new)
+
+    def remove_contact_row(self, idx):
+        self.contact_list.delete(idx)
 
     def _on_contact_select(self, event):
         sel = self.contact_list.curselection()
@@ -386,15 +495,12 @@ class NormalView(tk.Frame):
 
     def _menu_modify(self):
         self.controller.modify_contact()
-        self.refresh_contacts()
 
     def _menu_delete(self):
         self.controller.delete_contact()
-        self.refresh_contacts()
 
     def _add_contact(self):
         self.controller.add_new_contact()
-        self.refresh_contacts()
 
     # --- 发送与快捷键逻辑 ---
     def _send_msg_action(self):
@@ -428,32 +534,30 @@ class NormalView(tk.Frame):
         return None
 
     def log(self, text, tag="normal_peer", no_newline=False):
-        self.text_area.config(state="normal")
-        self.text_area.insert(tk.END, text + ("" if no_newline else "\n"), tag)
-        self.text_area.see(tk.END)
-        self.text_area.config(state="disabled")
+        self.history_window.append_raw(text + ("" if no_newline else "\n"), tag)
 
 
 # === WPS 视图 ===
 class WpsView(tk.Frame):
     def __init__(self, master, controller, is_dark=False):
-        scheme = THEMES["wps"]["dark"] if is_dark else THEMES["wps"]["light"]
-        super().__init__(master, bg=scheme["bg_root"])
+        super().__init__(master)
         self.controller = controller
         self._drag_data = {"x": 0, "y": 0}
-        self.scheme = scheme
+        # 颜色都经 theme 登记，切换深浅色时由 apply_scheme 原地重设，文档内容不受影响
+        self.theme = ThemeBinder(THEMES["wps"], is_dark)
+        self.theme(self, bg="bg_root")
 
-        self._build_title_bar(scheme)
+        self._build_title_bar()
 
         # Ribbon 功能区
-        self.ribbon_container = tk.Frame(self, bg=scheme["bg_ribbon"], height=120)
+        self.ribbon_container = self.theme(tk.Frame(self, height=120), bg="bg_ribbon")
         self.ribbon_container.pack(fill="x", side="top")
         self.ribbon_container.pack_propagate(False)
 
-        self.tabs_frame = tk.Frame(self.ribbon_container, bg=scheme["bg_ribbon"], height=30)
+        self.tabs_frame = self.theme(tk.Frame(self.ribbon_container, height=30), bg="bg_ribbon")
         self.tabs_frame.pack(fill="x", side="top")
 
-        self.tools_panel = tk.Frame(self.ribbon_container, bg=scheme["bg_ribbon"])
+        self.tools_panel = self.theme(tk.Frame(self.ribbon_container), bg="bg_ribbon")
         self.tools_panel.pack(fill="both", expand=True, padx=10, pady=5)
 
         self.menu_tabs = [
@@ -467,124 +571,172 @@ class WpsView(tk.Frame):
             "会员专享",
         ]
         self.current_tab_lbls = {}
-        self._init_menu_tabs(scheme)
+        self._init_menu_tabs(self.scheme)
         self._switch_tab("开始")
 
-        main_paned = tk.PanedWindow(self, orient="horizontal", bg=scheme["bg_root"], sashwidth=4)
+        main_paned = self.theme(tk.PanedWindow(self, orient="horizontal", sashwidth=4), bg="bg_root")
         main_paned.pack(fill="both", expand=True)
 
-        doc_container = tk.Frame(main_paned, bg=scheme["bg_root"])
+        doc_container = self.theme(tk.Frame(main_paned), bg="bg_root")
         main_paned.add(doc_container)
-        paper = tk.Frame(doc_container, bg=scheme["bg_paper"], padx=40, pady=40)
+        paper = self.theme(tk.Frame(doc_container, padx=40, pady=40), bg="bg_paper")
         paper.pack(fill="both", expand=True, padx=20, pady=10)
 
         self.doc_editor = tk.Text(
             paper,
-            bg=scheme["bg_paper"],
-            fg=scheme["fg_text"],
             font=THEMES["wps"]["font_doc"],
             wrap="word",
             bd=0,
             undo=True,
-            insertbackground=scheme["fg_text"],
         )
+        self.theme(self.doc_editor, bg="bg_paper", fg="fg_text", insertbackground="fg_text")
         self.doc_editor.pack(fill="both", expand=True)
+        self.doc_editor.bind("<Control-o>", self._open_document)
+        self.doc_editor.bind("<Control-s>", self._save_document)
         self._init_doc_tags()
+        self.document = DocumentFile(
+            self.doc_editor,
+            DOC_CHUNK_BYTES,
+            DOC_SLICE_MS,
+            DOC_ENCODING,
+            on_progress=self._on_doc_progress,
+            on_done=self._on_doc_loaded,
+        )
         self.doc_editor.insert(
             "1.0",
             "二、系统参数定义\n\n1. 质量浓度范围:\n   Range: 0 to 1000 ug/m3\n\n(在此处继续编写文档...)\n",
         )
 
-        self._build_sidebar(main_paned, scheme)
+        self._build_sidebar(main_paned)
+
+    @property
+    def is_dark(self):
+        return self.theme.is_dark
+
+    @property
+    def scheme(self):
+        return self.theme.scheme
+
+    def apply_scheme(self, is_dark):
+        """切换深浅色：原地重设登记过的颜色；Ribbon 标签页与工具栏按新配色重绘"""
+        self.theme.apply(is_dark)
+        self._switch_tab(self.active_tab)
 
+    def on_show(self):
+        """视图从缓存中重新显示时调用（WPS 使用自绘标题栏，无需额外处理）"""
+        pass
+
+    @stats.timed("wps.render_history")
     def render_history(self, records, target_name):
-        self.chat_log.config(state="normal")
-        self.chat_log.delete("1.0", tk.END)
-        for rec in records:
-            self._insert_wps_record(rec, target_name)
-        self.chat_log.see(tk.END)
-        self.chat_log.config(state="disabled")
-
-    def append_msg(self, record, sender_name):
-        self.chat_log.config(state="normal")
-        self._insert_wps_record(record, sender_name)
-        self.chat_log.see(tk.END)
-        self.chat_log.config(state="disabled")
-
-    def _insert_wps_record(self, rec, name):
+        self.history_window.sync(records, target_name)
+
+    @stats.timed("wps.append_msg")
+    def append_msg(self, records, sender_name):
+        if not isinstance(records, (list, tuple)):
+            records = [records]
+        self.history_window.append(records, sender_name)
+
+    def _wps_record_segments(self, rec, name):
         tag = "ai_me" if rec["type"] == "self" else "ai_peer"
         header = f"[{name} {rec['time']}]"
-        self.chat_log.insert(tk.END, header + "\n", "time_tag")
-        self.chat_log.insert(tk.END, rec["msg"] + "\n\n", tag)
+        if rec.get("status") == "failed":
+            header += " 未送达"
+        return (header + "\n", "time_tag", rec["msg"] + "\n\n", tag)
 
-    def _build_title_bar(self, style):
-        title_bar = tk.Frame(self, bg=style["bg_header"], height=35)
+    def _build_title_bar(self):
+        title_bar = self.theme(tk.Frame(self, height=35), bg="bg_header")
         title_bar.pack(fill="x", side="top")
         title_bar.pack_propagate(False)
         title_bar.bind("<Button-1>", self.start_move)
         title_bar.bind("<B1-Motion>", self.do_move)
 
-        tk.Label(
-            title_bar,
-            text=" W ",
-            bg=style["bg_header"],
-            fg="white",
-            font=("Arial", 12, "bold"),
+        self.theme(
+            tk.Label(
+                title_bar,
+                text=" W ",
+                fg="white",
+                font=("Arial", 12, "bold"),
+            ),
+            bg="bg_header",
         ).pack(side="left", padx=10)
 
+        for text, cmd in (("打开", self._open_document), ("保存", self._save_document)):
+            btn = self.theme(tk.Label(title_bar, text=text, fg="white", font=THEMES["wps"]["font_ui"], padx=6), bg="bg_header")
+            btn.pack(side="left")
+            btn.bind("<Button-1>", lambda e, c=cmd: c())
+
         # [修复] 这里的 title 从全局 THEMES 读取
-        tk.Label(
+        self.title_label = tk.Label(
             title_bar,
             text=THEMES["wps"]["title"],
-            bg=style["bg_header"],
             fg="white",
             font=THEMES["wps"]["font_ui"],
-        ).pack(side="left")
+        )
+        self.theme(self.title_label, bg="bg_header")
+        self.title_label.pack(side="left")
 
         btn_close = tk.Label(
             title_bar,
             text=" × ",
-            bg=style["bg_header"],
             fg="white",
             font=("Arial", 14),
             width=3,
         )
+        self.theme(btn_close, bg="bg_header")
         btn_close.pack(side="right")
         btn_close.bind("<Button-1>", lambda e: self.master.destroy())
 
         btn_min = tk.Label(
             title_bar,
             text=" — ",
-            bg=style["bg_header"],
             fg="white",
             font=("Arial", 14),
             width=3,
         )
+        self.theme(btn_min, bg="bg_header")
         btn_min.pack(side="right")
         btn_min.bind("<Button-1>", lambda e: self.master.iconify())
 
-    def _build_sidebar(self, parent, style):
-        sidebar = tk.Frame(parent, width=300, bg=style["bg_paper"])
+    def _build_sidebar(self, parent):
+        sidebar = self.theme(tk.Frame(parent, width=300), bg="bg_paper")
         parent.add(sidebar)
-        tk.Label(
-            sidebar,
-            text="✨ WPS AI 助手",
-            font=("微软雅黑", 10, "bold"),
-            bg=style["bg_paper"],
-            fg=style["bg_header"],
-            pady=10,
+        self.theme(
+            tk.Label(
+                sidebar,
+                text="✨ WPS AI 助手",
+                font=("微软雅黑", 10, "bold"),
+                pady=10,
+            ),
+            bg="bg_paper",
+            fg="bg_header",
         ).pack(fill="x")
 
+        # 聊天记录搜索：回车弹出结果列表
+        search_frm = self.theme(tk.Frame(sidebar), bg="bg_root")
+        search_frm.pack(fill="x", padx=10, pady=(0, 5))
+        self.theme(tk.Label(search_frm, text="🔍", fg="#aaa"), bg="bg_root").pack(side="left")
+        self.search_input = tk.Entry(
+            search_frm,
+            bd=0,
+            font=THEMES["wps"]["font_ui"],
+        )
+        self.theme(self.search_input, bg="bg_root", fg="fg_ui", insertbackground="fg_text")
+        self.search_input.pack(side="left", fill="x", expand=True, padx=5)
+        self.search_input.bind("<Return>", lambda e: self._open_history_search())
+
         self.chat_log = tk.Text(
             sidebar,
-            bg=style["bg_paper"],
-            fg=style["fg_ui"],
             font=THEMES["wps"]["font_ui"],
             state="disabled",
             bd=0,
             wrap="word",
         )
+        self.theme(self.chat_log, bg="bg_paper", fg="fg_ui")
         self.chat_log.pack(side="top", fill="both", expand=True, padx=5)
+        self.history_window = HistoryWindow(
+            self.chat_log, self._wps_record_segments, HISTORY_PAGE_SIZE, HISTORY_MAX_LIVE, interval=FRAME_INTERVAL_MS
+        )
+        self.chat_log.config(yscrollcommand=self.history_window.on_yscroll)
 
         self.chat_log.tag_config(
             "ai_me",
@@ -596,33 +748,45 @@ class WpsView(tk.Frame):
         )
         self.chat_log.tag_config(
             "ai_peer",
-            foreground=style["fg_ui"],
-            background=style["bg_root"],
             justify="left",
             rmargin=20,
             lmargin1=5,
         )
+        self.theme.tag(self.chat_log, "ai_peer", foreground="fg_ui", background="bg_root")
         self.chat_log.tag_config("time_tag", foreground="#999", font=("Arial", 8), justify="center")
+        self.chat_log.tag_config("search_hit", background="#fff3b0")
 
-        input_frm = tk.Frame(sidebar, bg=style["bg_root"], height=40)
+        input_frm = self.theme(tk.Frame(sidebar, height=40), bg="bg_root")
         input_frm.pack(side="bottom", fill="x", padx=10, pady=10)
-        tk.Label(input_frm, text="Ask:", bg=style["bg_root"], fg="#aaa").pack(side="left")
+        self.theme(tk.Label(input_frm, text="Ask:", fg="#aaa"), bg="bg_root").pack(side="left")
         self.input = tk.Entry(
             input_frm,
-            bg=style["bg_root"],
-            fg=style["fg_ui"],
             bd=0,
             font=THEMES["wps"]["font_ui"],
-            insertbackground=style["fg_text"],
         )
+        self.theme(self.input, bg="bg_root", fg="fg_ui", insertbackground="fg_text")
         self.input.pack(side="left", fill="x", expand=True, padx=5)
         self.input.bind("<Return>", self._on_return)
 
+    def _open_history_search(self):
+        SearchPopup(
+            self,
+            self.controller.search_history,
+            self.controller.open_search_hit,
+            query=self.search_input.get(),
+            bg=self.scheme["bg_paper"],
+            fg=self.scheme["fg_ui"],
+        )
+
+    def show_search_hit(self, records, target_name, index):
+        start, end = self.history_window.load_around(records, target_name, index)
+        self.chat_log.tag_add("search_hit", start, end)
+        self.chat_log.tag_raise("search_hit")
+        self.chat_log.see(start)
+
     # [新增] 重置聊天区方法
     def reset_chat_area(self):
-        self.chat_log.config(state="normal")
-        self.chat_log.delete("1.0", tk.END)
-        self.chat_log.config(state="disabled")
+        self.history_window.clear()
         self.controller.target_addr = None
 
     def _init_menu_tabs(self, style):
@@ -638,7 +802,7 @@ class WpsView(tk.Frame):
             )
             lbl.pack(side="left")
             lbl.bind("<Button-1>", lambda e, t=tab: self._switch_tab(t))
-            lbl.bind("<Enter>", lambda e, l=lbl: l.config(bg=style["bg_hover"]))
+            lbl.bind("<Enter>", lambda e, l=lbl: l.config(bg=self.scheme["bg_hover"]))
             lbl.bind("<Leave>", lambda e, l=lbl, t=tab: self._reset_tab_style(l, t))
             self.current_tab_lbls[tab] = lbl
 
@@ -769,60 +933,76 @@ class WpsView(tk.Frame):
         ).pack(expand=True)
 
     def _init_doc_tags(self):
-        self.doc_editor.tag_config("bold", font=("Times New Roman", 12, "bold"))
-        self.doc_editor.tag_config("italic", font=("Times New Roman", 12, "italic"))
-        self.doc_editor.tag_config("underline", underline=True)
-        self.doc_editor.tag_config("overstrike", overstrike=True)
+        # 字符样式统一走 StyleRegistry（同一组合复用一个标签），段落标签名字固定，本身不会重复
+        self.styles = StyleRegistry(self.doc_editor, THEMES["wps"]["font_doc"])
         self.doc_editor.tag_config("align_left", justify="left")
         self.doc_editor.tag_config("align_center", justify="center")
         self.doc_editor.tag_config("align_right", justify="right")
 
-    def _toggle_tag(self, tag_name):
+    def _apply_style(self, **changes):
         try:
-            if tag_name in self.doc_editor.tag_names("sel.first"):
-                self.doc_editor.tag_remove(tag_name, "sel.first", "sel.last")
-            else:
-                self.doc_editor.tag_add(tag_name, "sel.first", "sel.last")
+            self.styles.apply("sel.first", "sel.last", **changes)
         except tk.TclError:
-            pass
+            pass  # 没有选区
 
-    def _apply_font_family(self):
-        f_family = self.cb_font.get()
-        tag_name = f"font_{f_family}"
-        self.doc_editor.tag_config(tag_name, font=(f_family, int(self.cb_size.get())))
+    def _toggle_tag(self, attr):
         try:
-            self.doc_editor.tag_add(tag_name, "sel.first", "sel.last")
-        except:
+            self.styles.toggle("sel.first", "sel.last", attr)
+        except tk.TclError:
             pass
 
+    def _apply_font_family(self):
+        self._apply_style(family=self.cb_font.get())
+
     def _apply_font_size(self):
         try:
             size = int(self.cb_size.get())
-            tag_name = f"size_{size}"
-            self.doc_editor.tag_config(tag_name, font=(self.cb_font.get(), size))
-            self.doc_editor.tag_add(tag_name, "sel.first", "sel.last")
-        except:
-            pass
+        except ValueError:
+            return
+        self._apply_style(size=size)
 
     def _choose_fg_color(self):
         color = colorchooser.askcolor(title="选择字体颜色")[1]
         if color:
-            tag_name = f"fg_{color}"
-            self.doc_editor.tag_config(tag_name, foreground=color)
-            try:
-                self.doc_editor.tag_add(tag_name, "sel.first", "sel.last")
-            except:
-                pass
+            self._apply_style(fg=color)
 
     def _choose_bg_color(self):
         color = colorchooser.askcolor(title="选择底纹颜色")[1]
         if color:
-            tag_name = f"bg_{color}"
-            self.doc_editor.tag_config(tag_name, background=color)
+            self._apply_style(bg=color)
+
+    # --- 文档打开 / 保存 ---
+    def _open_document(self, event=None):
+        path = filedialog.askopenfilename(parent=self, filetypes=[("文本文件", "*.txt *.md *.log"), ("所有文件", "*.*")])
+        if path:
+            try:
+                self.document.open(path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("打开失败", str(e), parent=self)
+            else:
+                self.styles.clear()
+                self.title_label.config(text=f"{os.path.basename(path)} - 加载中 0%")
+        return "break"  # 屏蔽 Text 自带的 Ctrl+O（插入空行）
+
+    def _save_document(self, event=None):
+        if self.document.loading:
+            return "break"
+        path = self.document.path or filedialog.asksaveasfilename(parent=self, defaultextension=".txt")
+        if path:
             try:
-                self.doc_editor.tag_add(tag_name, "sel.first", "sel.last")
-            except:
-                pass
+                self.document.save(path)
+            except (OSError, ValueError) as e:  # ValueError: 编辑区中有当前编码无法表示的字符
+                messagebox.showerror("保存失败", str(e), parent=self)
+            else:
+                self.title_label.config(text=f"{os.path.basename(path)} - WPS Office")
+        return "break"
+
+    def _on_doc_progress(self, done, total):
+        name = os.path.basename(self.document.path)
+        self.title_label.config(text=f"{name} - 加载中 {done * 100 // total}%")
+
+    def _on_doc_loaded(self, path):
+        self.title_label.config(text=f"{os.path.basename(path)} - WPS Office")
 
     def _set_align(self, align):
         try:
@@ -860,7 +1040,4 @@ class WpsView(tk.Frame):
         self.controller.handle_chat_send(msg, "ai_me")
 
     def log(self, text, tag="ai_peer", no_newline=False):
-        self.chat_log.config(state="normal")
-        self.chat_log.insert(tk.END, text + ("" if no_newline else "\n"), tag)
-        self.chat_log.see(tk.END)
-        self.chat_log.config(state="disabled")
+        self.history_window.append_raw(text + ("" if no_newline else "\n"), tag)